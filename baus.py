@@ -1,12 +1,17 @@
 import os
 import sys
 import time
+import random
+import numpy as np
 import traceback
 from baus import models
 from baus import slr
 from baus import earthquake
 from baus import ual
 from baus import validation
+from baus import profiling
+from baus import checkpoint
+from baus import outputs
 import pandas as pd
 import orca
 import socket
@@ -31,6 +36,9 @@ CURRENT_COMMIT = os.popen('git rev-parse HEAD').read()
 COMPARE_TO_NO_PROJECT = True
 NO_PROJECT = 611
 EARTHQUAKE = False
+PROFILE = False
+CHECKPOINT = True
+RESUME_FROM = None
 
 IN_YEAR, OUT_YEAR = 2010, 2050
 COMPARE_AGAINST_LAST_KNOWN_GOOD = False
@@ -72,6 +80,29 @@ parser.add_argument('--mode', action='store', dest='mode',
 parser.add_argument('--disable-slack', action='store_true', dest='noslack',
                     help='disable slack outputs')
 
+parser.add_argument('--run-number', action='store', dest='run_number',
+                    type=int, help='use this run number rather than the '
+                    'next one in RUNNUM')
+
+parser.add_argument('--random-seed', action='store', dest='random_seed',
+                    type=int, help='seed the random number generators')
+
+parser.add_argument('--profile', action='store_true', dest='profile',
+                    help='write per-step timing and memory to '
+                    'runs/run{N}_profile.csv')
+
+parser.add_argument('--resume-from', action='store', dest='resume_from',
+                    type=int, help='restart a simulation from the '
+                    'checkpoint written at the end of this year')
+
+parser.add_argument('--resume-run', action='store', dest='resume_run',
+                    type=int, help='run number of the checkpoint to resume '
+                    'from (defaults to the previous run)')
+
+parser.add_argument('--no-checkpoint', action='store_true',
+                    dest='no_checkpoint',
+                    help='do not write a checkpoint at the end of each year')
+
 options = parser.parse_args()
 
 if options.console:
@@ -95,6 +126,22 @@ if options.mode:
 if options.noslack:
     SLACK = False
 
+if options.profile:
+    PROFILE = True
+
+if options.resume_from:
+    RESUME_FROM = options.resume_from
+
+if options.no_checkpoint:
+    CHECKPOINT = False
+
+if options.run_number:
+    orca.add_injectable("run_number", options.run_number)
+
+if options.random_seed is not None:
+    np.random.seed(options.random_seed)
+    random.seed(options.random_seed)
+
 SCENARIO = orca.get_injectable("scenario")
 
 if INTERACT:
@@ -104,11 +151,17 @@ if INTERACT:
 
 run_num = orca.get_injectable("run_number")
 
+# by default resume from the run before this one
+RESUME_RUN = options.resume_run or run_num - 1
+
 if LOGS:
     print '***The Standard stream is being written to /runs/run{0}.log***'\
         .format(run_num)
     sys.stdout = sys.stderr = open("runs/run%d.log" % run_num, 'w')
 
+if PROFILE:
+    profiler = profiling.profile_steps("runs/run%d_profile.csv" % run_num)
+
 if SLACK:
     from slacker import Slacker
     slack = Slacker(os.environ["SLACK_TOKEN"])
@@ -252,8 +305,15 @@ def run_models(MODE, SCENARIO):
 
     elif MODE == "simulation":
 
+        # write out the state at the end of every year so a failed run
+        # can be restarted with --resume-from
+        checkpoint_models = ["checkpoint"] if CHECKPOINT else []
+
+        if RESUME_FROM:
+            checkpoint.read_checkpoint(RESUME_RUN, RESUME_FROM)
+
         # see above for docs on this
-        if not SKIP_BASE_YEAR:
+        if not SKIP_BASE_YEAR and not RESUME_FROM:
             orca.run([
 
                 "slr_inundate",
@@ -300,13 +360,14 @@ def run_models(MODE, SCENARIO):
                 "hazards_eq_summary",
                 "diagnostic_output"
 
-            ], iter_vars=[IN_YEAR])
+            ] + checkpoint_models, iter_vars=[IN_YEAR])
 
         # start the simulation in the next round - only the models above run
-        # for the IN_YEAR
-        years_to_run = range(IN_YEAR+EVERY_NTH_YEAR, OUT_YEAR+1,
+        # for the IN_YEAR (or the year we're resuming from)
+        start_year = RESUME_FROM or IN_YEAR
+        years_to_run = range(start_year+EVERY_NTH_YEAR, OUT_YEAR+1,
                              EVERY_NTH_YEAR)
-        models = get_simulation_models(SCENARIO)
+        models = get_simulation_models(SCENARIO) + checkpoint_models
         orca.run(models, iter_vars=years_to_run)
 
     elif MODE == "estimation":
@@ -379,6 +440,8 @@ if SLACK:
 try:
 
     run_models(MODE, SCENARIO)
+    # wait for the summary tables still being written in the background
+    outputs.flush_writes()
 
 except Exception as e:
     print traceback.print_exc()
@@ -390,6 +453,12 @@ except Exception as e:
     else:
         raise e
     sys.exit(0)
+finally:
+    # a failed run still writes out the summaries it got to
+    outputs.flush_writes(raise_errors=False)
+    if PROFILE:
+        print profiler.summary()
+        profiler.close()
 
 print "Finished", time.ctime()
 
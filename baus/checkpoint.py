@@ -0,0 +1,143 @@
+import os
+import re
+import random
+import shutil
+import numpy as np
+import pandas as pd
+import orca
+from schema import apply_schema, to_storable
+from outputs import flush_writes
+
+
+# checkpointing lets a long simulation be restarted from the end of any
+# simulated year rather than from the base year.  the dataframes are
+# written to an h5 and everything else which carries state from one year
+# to the next (accounts, parcel output, the logsum file bookkeeping and the
+# random number generator state) is pickled alongside it.  each checkpoint
+# is a full copy of the state, so only the last few of a run are kept
+
+
+# tables which are modified as the simulation runs - any other table which
+# has been replaced by a dataframe during the run (via orca.add_table) is
+# saved too, except for the ones which get recomputed every year anyway
+CHECKPOINT_TABLES = ["parcels", "buildings", "households", "jobs",
+                     "residential_units"]
+TRANSIENT_TABLES = ["feasibility"]
+
+# injectables which carry state across years - all the
+# previous_{type}_logsum_{type,file} injectables are saved as well
+CHECKPOINT_INJECTABLES = ["coffer", "base_year_measures"]
+
+
+def checkpoint_fnames(run_number, year):
+    base = os.path.join("runs", "run%d_checkpoint_%d" % (run_number, year))
+    return base + ".h5", base + ".pkl"
+
+
+def _checkpoint_tables():
+    tables = [t for t in CHECKPOINT_TABLES if orca.is_table(t)]
+    for name in orca.list_tables():
+        if name in tables or name in TRANSIENT_TABLES:
+            continue
+        if isinstance(orca.get_raw_table(name), orca.DataFrameWrapper):
+            tables.append(name)
+    return tables
+
+
+def _checkpoint_injectables():
+    names = CHECKPOINT_INJECTABLES + [
+        name for name in orca.list_injectables()
+        if name.startswith("previous_")]
+    return [name for name in names if orca.is_injectable(name)]
+
+
+# a resumed run gets a new run number, but some summaries read back the
+# outputs of earlier years (e.g. the parcel data diff in the final year
+# reads the base year parcel data), so the outputs of the resumed run for
+# the years up to the checkpoint are copied to the new run number
+def copy_run_outputs(from_run, to_run, year):
+    pattern = re.compile(r"run%d_(.+)_(\d{4})\.(csv|h5|log)$" % from_run)
+    for fname in os.listdir("runs"):
+        m = pattern.match(fname)
+        if m is None or m.group(1) == "checkpoint" or \
+                int(m.group(2)) > year:
+            continue
+        shutil.copyfile(os.path.join("runs", fname), os.path.join(
+            "runs", "run%d_%s_%s.%s" % ((to_run,) + m.groups())))
+
+
+# removes all but the last keep checkpoints of the run, which are those of
+# the latest years - keep of None keeps them all
+def remove_old_checkpoints(run_number, keep):
+    if keep is None:
+        return
+    pattern = re.compile(r"run%d_checkpoint_(\d{4})\.pkl$" % run_number)
+    years = sorted(int(m.group(1)) for m in
+                   [pattern.match(fname) for fname in os.listdir("runs")]
+                   if m is not None)
+    for year in years[:-keep] if keep > 0 else years:
+        for fname in checkpoint_fnames(run_number, year):
+            if os.path.exists(fname):
+                os.remove(fname)
+
+
+def write_checkpoint(run_number, year, keep=None):
+    h5, pkl = checkpoint_fnames(run_number, year)
+
+    # the outputs of the year are part of the state of the run
+    flush_writes()
+
+    store = pd.HDFStore(h5, "w", complevel=1, complib="blosc")
+    for name in _checkpoint_tables():
+        store[name] = to_storable(orca.get_table(name).local)
+    store.close()
+
+    summary = orca.get_injectable("summary")
+    pd.to_pickle({
+        "year": year,
+        "injectables": {name: orca.get_injectable(name)
+                        for name in _checkpoint_injectables()},
+        "parcel_output": summary.parcel_output,
+        "zone_output": summary.zone_output,
+        "numpy_random_state": np.random.get_state(),
+        "random_state": random.getstate()
+    }, pkl)
+
+    print "Wrote checkpoint for %d to %s" % (year, h5)
+
+    # only once the new checkpoint has been written
+    remove_old_checkpoints(run_number, keep)
+
+
+def read_checkpoint(run_number, year):
+    h5, pkl = checkpoint_fnames(run_number, year)
+    if not os.path.exists(h5) or not os.path.exists(pkl):
+        raise Exception("No checkpoint for year %d of run %d" %
+                        (year, run_number))
+
+    store = pd.HDFStore(h5, "r")
+    for key in store.keys():
+        orca.add_table(key[1:], apply_schema(key[1:], store[key]))
+    store.close()
+
+    state = pd.read_pickle(pkl)
+    for name, value in state["injectables"].items():
+        orca.add_injectable(name, value)
+
+    summary = orca.get_injectable("summary")
+    summary.parcel_output = state["parcel_output"]
+    summary.zone_output = state["zone_output"]
+
+    np.random.set_state(state["numpy_random_state"])
+    random.setstate(state["random_state"])
+
+    new_run_number = orca.get_injectable("run_number")
+    if new_run_number != run_number:
+        copy_run_outputs(run_number, new_run_number, year)
+
+    print "Restored checkpoint for %d from %s" % (year, h5)
+
+
+@orca.step()
+def checkpoint(run_number, year, settings):
+    write_checkpoint(run_number, year, settings.get("checkpoints_to_keep", 1))
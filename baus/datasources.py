@@ -1,6 +1,7 @@
 import numpy as np
 import pandas as pd
 import os
+import shutil
 from urbansim_defaults import datasources
 from urbansim_defaults import utils
 from urbansim.utils import misc
@@ -8,6 +9,7 @@ import orca
 import preprocessing
 from utils import geom_id_to_parcel_id, parcel_id_to_geom_id
 from utils import nearest_neighbor
+from schema import apply_schema, cast_column, SCHEMA
 
 
 #####################
@@ -40,6 +42,15 @@ def store(settings):
     return pd.HDFStore(os.path.join(misc.data_dir(), settings["store"]))
 
 
+# entry points which only read a few columns of the big tables (e.g.
+# capacity_calculator.py and export.py) can set this to True before using
+# any tables - see lazy_store_table below.  it must stay False for
+# simulations as the models change the tables' local columns
+@orca.injectable()
+def lazy_tables():
+    return False
+
+
 @orca.injectable(cache=True)
 def limits_settings(settings, scenario):
     # for limits, we inherit from the default
@@ -373,7 +384,9 @@ def zoning_scenario(parcels_geography, scenario, settings):
 
 
 @orca.table(cache=True)
-def parcels(store):
+def parcels(store, settings, lazy_tables):
+    if lazy_tables:
+        return lazy_store_table('parcels', 'parcels', store, settings)
     return store['parcels']
 
 
@@ -430,23 +443,73 @@ def parcels_subzone():
                        index_col='PARCEL_ID')
 
 
-@orca.table(cache=False)
-def mandatory_accessibility():
-    fname = get_logsum_file('mandatory')
-    df = pd.read_csv(os.path.join(
-        misc.data_dir(), fname))
-    df.loc[df.subzone == 0, 'subzone'] = 'c'  # no walk
-    df.loc[df.subzone == 1, 'subzone'] = 'a'  # short walk
-    df.loc[df.subzone == 2, 'subzone'] = 'b'  # long walk
-    df['taz_sub'] = df.taz.astype('str') + df.subzone
-    return df.set_index('taz_sub')
+# the logsum csvs are large and the tables below can't be cached by orca as
+# the file changes with the year and scenario, so each processed csv is
+# written to an h5 in data/cache the first time it's read and kept in memory
+# for the rest of the run - both are keyed by file name and invalidated when
+# the csv changes.  the modification time of the csv is stored with each
+# table in the h5 since the tables in one h5 are written at different times
+_logsum_tables = {}
+
+
+def cached_logsum_table(fname, process_func, mtime):
+    node = process_func.__name__
+    cache_dir = os.path.join(misc.data_dir(), "cache")
+    cache = os.path.join(cache_dir, os.path.splitext(fname)[0] + ".h5")
+
+    if os.path.exists(cache):
+        store = pd.HDFStore(cache, "r")
+        df = store[node] if node in store and getattr(
+            store.get_storer(node).attrs, "source_mtime", None) == mtime \
+            else None
+        store.close()
+        if df is not None:
+            return df
+
+    df = process_func(pd.read_csv(os.path.join(misc.data_dir(), fname)))
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    # the caches of the runs of a farm are links to caches which are shared
+    # by all the runs (see run_farm.py), so a run writes to its own copy
+    if os.path.islink(cache):
+        shared = os.path.realpath(cache)
+        os.unlink(cache)
+        shutil.copy2(shared, cache)
+    store = pd.HDFStore(cache, "a")
+    store[node] = df
+    store.get_storer(node).attrs.source_mtime = mtime
+    store.close()
+    return df
 
 
-@orca.table(cache=False)
-def non_mandatory_accessibility():
-    fname = get_logsum_file('non_mandatory')
-    df = pd.read_csv(os.path.join(
-        misc.data_dir(), fname))
+def read_logsum_table(fname, process_func):
+    path = os.path.join(misc.data_dir(), fname)
+    key = (fname, process_func.__name__, os.path.getmtime(path))
+
+    if key not in _logsum_tables:
+        _logsum_tables[key] = cached_logsum_table(fname, process_func, key[2])
+
+    # hand out a copy so the cached table can't be modified by its users
+    return _logsum_tables[key].copy()
+
+
+def warm_logsum_cache():
+    # writes the cache of every logsum file in the settings which exists,
+    # without keeping the tables - run_farm.py calls this once before it
+    # starts the runs so they only read the cache
+    settings = orca.get_injectable("settings")
+    for type, logsums in settings["logsums"].items():
+        process_func = process_segmentation if type == "segmentation" \
+            else process_accessibility
+        for fname in sorted(set(logsums.values())):
+            path = os.path.join(misc.data_dir(), fname)
+            if os.path.exists(path):
+                print "Caching %s" % fname
+                cached_logsum_table(fname, process_func,
+                                    os.path.getmtime(path))
+
+
+def process_accessibility(df):
     df.loc[df.subzone == 0, 'subzone'] = 'c'  # no walk
     df.loc[df.subzone == 1, 'subzone'] = 'a'  # short walk
     df.loc[df.subzone == 2, 'subzone'] = 'b'  # long walk
@@ -454,11 +517,7 @@ def non_mandatory_accessibility():
     return df.set_index('taz_sub')
 
 
-@orca.table(cache=False)
-def accessibilities_segmentation():
-    fname = get_logsum_file('segmentation')
-    df = pd.read_csv(os.path.join(
-        misc.data_dir(), fname))
+def process_segmentation(df):
     df['AV'] = df['hasAV'].apply(lambda x: 'AV' if x == 1 else 'noAV')
     df['label'] = (df['incQ_label'] + '_' + df['autoSuff_label'] +
                    '_' + df['AV'])
@@ -468,6 +527,75 @@ def accessibilities_segmentation():
     return df
 
 
+@orca.table(cache=False)
+def mandatory_accessibility():
+    fname = get_logsum_file('mandatory')
+    return read_logsum_table(fname, process_accessibility)
+
+
+@orca.table(cache=False)
+def non_mandatory_accessibility():
+    fname = get_logsum_file('non_mandatory')
+    return read_logsum_table(fname, process_accessibility)
+
+
+@orca.table(cache=False)
+def accessibilities_segmentation():
+    fname = get_logsum_file('segmentation')
+    return read_logsum_table(fname, process_segmentation)
+
+
+# each segment's logsum is shifted to start at zero, divided by this scale
+# and weighted by the share of persons in the segment
+LOGSUM_SCALES = {
+    'mandatory': 0.0134,
+    'non_mandatory': 0.0175
+}
+_weighted_logsums = {}
+
+
+def weighted_logsum(acc, seg, scale, by_zone=False):
+    cols = [col for col in acc.columns
+            if col in seg.columns and
+            col not in ['destChoiceAlt', 'taz', 'subzone']]
+    df = acc[cols]
+    if by_zone:
+        df = df.groupby(acc.taz).median()
+    return ((df - df.min()) / scale * seg.loc[0, cols]).sum(axis=1)
+
+
+def get_weighted_logsum(type, by_zone=False):
+    # the weighted sums only depend on the logsum files for the year and
+    # scenario, so compute each one once per run
+    fname = get_logsum_file(type)
+    seg_fname = get_logsum_file('segmentation')
+    key = (fname, seg_fname, by_zone)
+    if key not in _weighted_logsums:
+        _weighted_logsums[key] = weighted_logsum(
+            read_logsum_table(fname, process_accessibility),
+            read_logsum_table(seg_fname, process_segmentation),
+            LOGSUM_SCALES[type], by_zone)
+    return _weighted_logsums[key]
+
+
+@orca.table(cache=True, cache_scope='iteration')
+def weighted_logsums():
+    # indexed by taz subzone
+    return pd.DataFrame({
+        "cml": get_weighted_logsum('mandatory'),
+        "cnml": get_weighted_logsum('non_mandatory')
+    })
+
+
+@orca.table(cache=True, cache_scope='iteration')
+def zone_weighted_logsums():
+    # indexed by taz
+    return pd.DataFrame({
+        "cml": get_weighted_logsum('mandatory', by_zone=True),
+        "cnml": get_weighted_logsum('non_mandatory', by_zone=True)
+    })
+
+
 def get_logsum_file(type='mandatory'):
     logsums = orca.get_injectable('settings')['logsums'][type]
     sc = orca.get_injectable('scenario')
@@ -533,19 +661,32 @@ def reprocess_dev_projects(df):
     # constantly be redeveloping projects, but it's a common error for users
     # to make in their development project configuration
     df = df.sort_values(["geom_id", "year_built"])
-    prev_geom_id = None
-    for index, rec in df.iterrows():
-        if rec.geom_id == prev_geom_id:
-            df.loc[index, "action"] = "add"
-        prev_geom_id = rec.geom_id
+    later = df.geom_id.duplicated() & df.geom_id.notnull()
+    df.loc[later, "action"] = "add"
 
     return df
 
 
+# the development projects csv doesn't depend on the scenario, so it's read
+# and reprocessed once per process and kept in memory, keyed by its
+# modification time, for all the scenarios run in the same process
+_dev_projects = {}
+
+
+def read_dev_projects():
+    path = os.path.join(misc.data_dir(), "development_projects.csv")
+    key = os.path.getmtime(path)
+
+    if key not in _dev_projects:
+        _dev_projects.clear()
+        _dev_projects[key] = reprocess_dev_projects(pd.read_csv(path))
+
+    return _dev_projects[key].copy()
+
+
 # shared between demolish and build tables below
 def get_dev_projects_table(scenario, parcels):
-    df = pd.read_csv(os.path.join(misc.data_dir(), "development_projects.csv"))
-    df = reprocess_dev_projects(df)
+    df = read_dev_projects()
 
     # this filters project by scenario
     if scenario in df:
@@ -554,31 +695,44 @@ def get_dev_projects_table(scenario, parcels):
 
     df = df.dropna(subset=['geom_id'])
 
-    cnts = df.geom_id.isin(parcels.geom_id).value_counts()
-    if False in cnts.index:
-        print "%d MISSING GEOMIDS!" % cnts.loc[False]
+    # look up the parcel id for every geom_id at once - projects on geom_ids
+    # which aren't in the parcels table are dropped.  a geom_id which is on
+    # more than one parcel goes to the first of them in the parcels table
+    geom_id = parcels.geom_id
+    dups = geom_id.duplicated()
+    if dups.any():
+        print "%d DUPLICATE GEOMIDS IN PARCELS!" % dups.sum()
+    geom_id = geom_id[~dups]
+    parcel_id = pd.Series(geom_id.index, index=geom_id.values).\
+        reindex(df.geom_id.values)
+    missing = parcel_id.isnull().values
+    if missing.any():
+        print "%d MISSING GEOMIDS!" % missing.sum()
+
+    df = df[~missing].reset_index(drop=True)
+    df.insert(0, "parcel_id", parcel_id.values[~missing].astype('int'))
 
-    df = df[df.geom_id.isin(parcels.geom_id)]
+    return df
 
-    geom_id = df.geom_id  # save for later
-    df = df.set_index("geom_id")
-    df = geom_id_to_parcel_id(df, parcels).reset_index()  # use parcel id
-    df["geom_id"] = geom_id.values  # add it back again cause it goes away
 
-    return df
+# cached so the csv is filtered and joined to parcels once and then shared
+# by the demolish and build tables
+@orca.table(cache=True)
+def dev_projects(parcels, scenario):
+    return get_dev_projects_table(scenario, parcels)
 
 
 @orca.table(cache=True)
-def demolish_events(parcels, settings, scenario):
-    df = get_dev_projects_table(scenario, parcels)
+def demolish_events(dev_projects):
+    df = dev_projects.to_frame()
 
     # keep demolish and build records
     return df[df.action.isin(["demolish", "build"])]
 
 
 @orca.table(cache=True)
-def development_projects(parcels, settings, scenario):
-    df = get_dev_projects_table(scenario, parcels)
+def development_projects(dev_projects, settings):
+    df = dev_projects.to_frame()
 
     for col in [
             'residential_sqft', 'residential_price', 'non_residential_rent']:
@@ -610,7 +764,7 @@ def development_projects(parcels, settings, scenario):
     print "Describe of development projects"
     # this makes sure dev projects has all the same columns as buildings
     # which is the point of this method
-    print df[orca.get_table('buildings').local_columns].describe()
+    print df[stored_columns('buildings')].describe()
 
     return df
 
@@ -623,24 +777,108 @@ def print_error_if_not_available(store, table):
     return store[table]
 
 
+# with lazy_tables, each column of a big store table is copied to its own
+# node in an h5 in data/cache the first time the table is used (the copy
+# is redone whenever the store changes).  the orca table then only holds
+# the index and every stored column is registered as a cached orca column
+# which reads just that node, so to_frame and computed columns only read
+# the columns they use.  stored columns which are overridden by a computed
+# column aren't registered
+_lazy_table_columns = {}
+
+
+def store_columns_fname(settings):
+    return os.path.join(misc.data_dir(), "cache", os.path.splitext(
+        os.path.basename(settings["store"]))[0] + "_columns.h5")
+
+
+def split_store_table(store, key, fname):
+    df = print_error_if_not_available(store, key)
+
+    cache = pd.HDFStore(fname, "a", complevel=1, complib="blosc")
+    for i, col in enumerate(df.columns):
+        cache["%s/c%d" % (key, i)] = df[col]
+    cache[key + "/index_values"] = pd.Series(df.index.values,
+                                             name=df.index.name)
+    # written last so a partly written table is redone next time
+    cache[key + "/column_names"] = pd.Series(df.columns)
+    cache.close()
+
+
+def column_reader(fname, node, dtype=None):
+    def read_column():
+        s = pd.read_hdf(fname, node)
+        return s if dtype is None else cast_column(s, dtype)
+    return read_column
+
+
+def lazy_store_table(name, key, store, settings):
+    fname = store_columns_fname(settings)
+    store_fname = os.path.join(misc.data_dir(), settings["store"])
+
+    if os.path.exists(fname) and \
+            os.path.getmtime(fname) < os.path.getmtime(store_fname):
+        os.remove(fname)
+    if not os.path.exists(os.path.dirname(fname)):
+        os.makedirs(os.path.dirname(fname))
+
+    cache = pd.HDFStore(fname, "a")
+    if key + "/column_names" not in cache:
+        cache.close()
+        split_store_table(store, key, fname)
+        cache = pd.HDFStore(fname, "a")
+    columns = cache[key + "/column_names"]
+    index = cache[key + "/index_values"]
+    cache.close()
+
+    _lazy_table_columns[name] = list(columns)
+    computed_columns = orca.list_columns_for_table(name)
+    for i, col in enumerate(columns):
+        if col not in computed_columns:
+            orca.add_column(name, col, column_reader(
+                fname, "%s/c%d" % (key, i), SCHEMA.get(name, {}).get(col)),
+                cache=True)
+
+    return pd.DataFrame(index=pd.Index(index.values, name=index.name))
+
+
+def stored_columns(name):
+    # the columns a table was loaded with from the store - for a lazy table
+    # these are orca columns rather than local columns, and they're only
+    # known once the table has been evaluated
+    local_columns = orca.get_table(name).local_columns
+    if name in _lazy_table_columns:
+        return _lazy_table_columns[name]
+    return local_columns
+
+
+def store_table(name, key, store, settings, lazy_tables):
+    if lazy_tables:
+        return lazy_store_table(name, key, store, settings)
+    return apply_schema(name, print_error_if_not_available(store, key))
+
+
 @orca.table(cache=True)
-def jobs(store):
-    return print_error_if_not_available(store, 'jobs_preproc')
+def jobs(store, settings, lazy_tables):
+    return store_table('jobs', 'jobs_preproc', store, settings, lazy_tables)
 
 
 @orca.table(cache=True)
-def households(store):
-    return print_error_if_not_available(store, 'households_preproc')
+def households(store, settings, lazy_tables):
+    return store_table('households', 'households_preproc', store, settings,
+                       lazy_tables)
 
 
 @orca.table(cache=True)
-def buildings(store):
-    return print_error_if_not_available(store, 'buildings_preproc')
+def buildings(store, settings, lazy_tables):
+    return store_table('buildings', 'buildings_preproc', store, settings,
+                       lazy_tables)
 
 
 @orca.table(cache=True)
-def residential_units(store):
-    return print_error_if_not_available(store, 'residential_units_preproc')
+def residential_units(store, settings, lazy_tables):
+    return store_table('residential_units', 'residential_units_preproc',
+                       store, settings, lazy_tables)
 
 
 @orca.table(cache=True)
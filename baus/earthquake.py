@@ -6,245 +6,247 @@ import datasources
 import variables
 import summaries
 
-from operator import itemgetter
-import itertools
-
 
 # after slr has inundated some parcels and removed buildings permanently,
 # earthquake model removes further buildings temporarily
 
+# year_built vintages used in the building codes - each is a list of
+# (first year, last year, code) with inclusive bounds
+VINTAGES_4 = [(-np.inf, 1940, 'G1'), (1941, 1960, 'G2'),
+              (1961, 1995, 'G3'), (1996, 2015, 'G4')]
+VINTAGES_5 = [(-np.inf, 1920, 'G1'), (1921, 1940, 'G2'),
+              (1941, 1960, 'G3'), (1961, 1995, 'G4'), (1996, 2015, 'G5')]
+VINTAGES_6 = [(-np.inf, 1920, 'G1'), (1921, 1940, 'G2'),
+              (1941, 1960, 'G3'), (1961, 1977, 'G4'), (1978, 1991, 'G5'),
+              (1992, 2015, 'G6')]
+VINTAGES_5P = [(-np.inf, 1950, 'G1'), (1951, 1971, 'G2'),
+               (1972, 1995, 'G3'), (1996, 2006, 'G4'), (2007, 2015, 'G5')]
+VINTAGES_OT = [(-np.inf, 1933, 'G1'), (1934, 1950, 'G2'),
+               (1951, 1972, 'G3'), (1973, 1996, 'G4'), (1997, 2006, 'G5'),
+               (2007, 2015, 'G6')]
+
+# (building class, stories code, min stories, max stories, vintages) - the
+# other buildings class has no stories code so its stories are not checked
+EQ_CODE_TABLE = [
+    ('SF', '01', 1, 1, VINTAGES_4),
+    ('SF', '2P', 2, np.inf, VINTAGES_5),
+    ('DU', '01', 1, 1, VINTAGES_4),
+    ('DU', '2P', 2, np.inf, VINTAGES_6),
+    ('MF', '01', 1, 1, VINTAGES_5),
+    ('MF', '25', 2, 5, VINTAGES_6),
+    ('MF', '5P', 6, np.inf, VINTAGES_5P),
+    ('OT', 'NN', None, None, VINTAGES_OT)
+]
+
+FRAGILITIES = {
+    1: ['SF01G4N', 'SF2PG5N', 'DU2PG6N', 'MF5PG5N', 'DU01G4N', 'MF25G6N',
+        'MF01G5N', 'OTNNG6N'],
+    1.2: ['SF01G3N', 'DU01G3N', 'DU2PG5N', 'MF25G5N', 'MF01G4N', 'OTNNG5N',
+          'MF5PG4N'],
+    1.3: ['SF2PG4N', 'MF5PG3N', 'OTNNG4N'],
+    1.4: ['MF5PG1N', 'OTNNG2N'],
+    1.5: ['MF01G3N', 'MF5PG2N', 'SF01G2N', 'DU01G2N', 'OTNNG3N'],
+    1.75: ['DU2PG3N', 'DU2PG4N'],
+    2: ['SF2PG3N', 'DU01G1N', 'DU2PG2N', 'MF01G2N', 'OTNNG1N'],
+    2.25: ['SF2PG2N'],
+    2.5: ['DU2PG1N', 'SF01G1N', 'SF2PG1N', 'MF01G1N', 'MF25G1N'],
+    3: ['MF25G2N', 'MF25G3N', 'MF25G4N'],
+    0: ['NNNNNNN']
+}
+FRAGILITY_BY_CODE = {code: float(fragility)
+                     for fragility, codes in FRAGILITIES.items()
+                     for code in codes}
+
+
+def code_buildings(buildings):
+    """
+    Assign an earthquake building code and fragility coefficient to each
+    building, based on building type, number of units, stories and year
+    built.  The code is building class + stories + vintage + retrofit,
+    e.g. 'SF01G4N', and all buildings built by the developer model get
+    'NNNNNNN'.
+
+    Parameters
+    ----------
+    buildings : DataFrame
+        Must contain building_type, residential_units, stories and
+        year_built
+
+    Returns
+    -------
+    code : Series
+        Building code, indexed like buildings
+    fragility : Series
+        Fragility coefficient, indexed like buildings
+    """
+    year_built = buildings.year_built
+    stories = buildings.stories
+    units = buildings.residential_units
+    building_type = buildings.building_type
+
+    a = pd.Series(np.nan, index=buildings.index, dtype='object')
+    b = a.copy()
+    c = a.copy()
+
+    existing = year_built <= 2015
+    single_family = building_type == 'HS'
+    multi_family = (building_type == 'HM') | (building_type == 'MR')
+    # 2, 3, & 4 units are considered duplex/triplex/quadplex and this
+    # assumes one-unit HM/MR buildings are also 5+ units (multifamily
+    # split by parcels)
+    duplex = (units == 2) | (units == 3) | (units == 4)
+    a[existing & single_family] = 'SF'
+    a[existing & multi_family & duplex] = 'DU'
+    a[existing & multi_family & ~duplex] = 'MF'
+    a[existing & ~single_family & ~multi_family] = 'OT'
+
+    for cls, stories_code, min_stories, max_stories, vintages in \
+            EQ_CODE_TABLE:
+        mask = a == cls
+        if min_stories is not None:
+            mask &= (stories >= min_stories) & (stories <= max_stories)
+        b[mask] = stories_code
+        for first_year, last_year, vintage in vintages:
+            c[mask & (year_built >= first_year) &
+              (year_built <= last_year)] = vintage
+
+    # new buildings built by the developer model
+    new = year_built > 2015
+    a[new] = b[new] = c[new] = 'NN'
+
+    # buildings which don't fall in any of the bins above (e.g. a missing
+    # year_built or zero stories) keep the code and fragility of the
+    # previous building, which is what the building-by-building loop this
+    # replaced did
+    code = a.ffill() + b.ffill() + c.ffill() + 'N'  # 'R' if retrofitted
+    fragility = code.map(FRAGILITY_BY_CODE).ffill()
+
+    return code, fragility
+
+
+# a seed in the settings makes the buildings which are destroyed
+# reproducible from run to run - the fragility, fire and new building
+# draws all come from this one stream, which is cached so that
+# earthquake_demolish continues where eq_code_buildings left off
+@orca.injectable(cache=True)
+def earthquake_random_state(settings):
+    seed = settings.get("earthquake_seed")
+    return np.random if seed is None else np.random.RandomState(seed)
+
+
 @orca.step()
-def eq_code_buildings(buildings, year, earthquake):
+def eq_code_buildings(buildings, year, earthquake, earthquake_random_state):
     if year == 2035 and earthquake:
         # tags buildings that exist in 2035 with a fragility coefficient
         # keeping in-model adds run time, but is important given developer
         # model stochastisitcy, that will change the building stock in 2035
         # this also allows us to change the building codes when retrofitting
         # policies are applied, thus changing fragility coefficients
-        buildings = buildings.to_frame()
-        code = []
-        fragilities = []
-
-        for i in buildings.index:
-            if (buildings['building_type'][i] == 'HS' and
-               buildings['year_built'][i] <= 2015):
-                a = 'SF'
-                if buildings['stories'][i] == 1:
-                    b = '01'
-                    if buildings['year_built'][i] <= 1940:
-                        c = 'G1'
-                    elif (buildings['year_built'][i] >= 1941 and
-                          buildings['year_built'][i] <= 1960):
-                        c = 'G2'
-                    elif (buildings['year_built'][i] >= 1961 and
-                          buildings['year_built'][i] <= 1995):
-                        c = 'G3'
-                    elif (buildings['year_built'][i] >= 1996 and
-                          buildings['year_built'][i] <= 2015):
-                        c = 'G4'
-                elif buildings['stories'][i] >= 2:
-                    b = '2P'
-                    if buildings['year_built'][i] <= 1920:
-                        c = 'G1'
-                    elif (buildings['year_built'][i] >= 1921 and
-                          buildings['year_built'][i] <= 1940):
-                        c = 'G2'
-                    elif (buildings['year_built'][i] >= 1941 and
-                          buildings['year_built'][i] <= 1960):
-                        c = 'G3'
-                    elif (buildings['year_built'][i] >= 1961 and
-                          buildings['year_built'][i] <= 1995):
-                        c = 'G4'
-                    elif (buildings['year_built'][i] >= 1996 and
-                          buildings['year_built'][i] <= 2015):
-                        c = 'G5'
-            elif ((buildings['building_type'][i] == 'HM' or
-                  buildings['building_type'][i] == 'MR') and
-                  buildings['year_built'][i] <= 2015):
-                if (buildings['residential_units'][i] == 2 or
-                   buildings['residential_units'][i] == 3 or
-                   buildings['residential_units'][i] == 4):
-                    a = 'DU'  # 2, 3, & 4 units
-                    # are considered duplex/triplex/quadplex
-                    if buildings['stories'][i] == 1:
-                        b = '01'
-                        if buildings['year_built'][i] <= 1940:
-                            c = 'G1'
-                        elif (buildings['year_built'][i] >= 1941 and
-                              buildings['year_built'][i] <= 1960):
-                            c = 'G2'
-                        elif (buildings['year_built'][i] >= 1961 and
-                              buildings['year_built'][i] <= 1995):
-                            c = 'G3'
-                        elif (buildings['year_built'][i] >= 1996 and
-                              buildings['year_built'][i] <= 2015):
-                            c = 'G4'
-                    if buildings['stories'][i] >= 2:
-                        b = '2P'
-                        if buildings['year_built'][i] <= 1920:
-                            c = 'G1'
-                        elif (buildings['year_built'][i] >= 1921 and
-                              buildings['year_built'][i] <= 1940):
-                            c = 'G2'
-                        elif (buildings['year_built'][i] >= 1941 and
-                              buildings['year_built'][i] <= 1960):
-                            c = 'G3'
-                        elif (buildings['year_built'][i] >= 1961 and
-                              buildings['year_built'][i] <= 1977):
-                            c = 'G4'
-                        elif (buildings['year_built'][i] >= 1978 and
-                              buildings['year_built'][i] <= 1991):
-                            c = 'G5'
-                        elif (buildings['year_built'][i] >= 1992 and
-                              buildings['year_built'][i] <= 2015):
-                            c = 'G6'
-                else:  # this assumes one-unit HM/MR buildings
-                    # are also 5+ units (multifamily split by parcels)
-                    a = 'MF'
-                    if buildings['stories'][i] == 1:
-                        b = '01'
-                        if buildings['year_built'][i] <= 1920:
-                            c = 'G1'
-                        elif (buildings['year_built'][i] >= 1921 and
-                              buildings['year_built'][i] <= 1940):
-                            c = 'G2'
-                        elif (buildings['year_built'][i] >= 1941 and
-                              buildings['year_built'][i] <= 1960):
-                            c = 'G3'
-                        elif (buildings['year_built'][i] >= 1961 and
-                              buildings['year_built'][i] <= 1995):
-                            c = 'G4'
-                        elif (buildings['year_built'][i] >= 1996 and
-                              buildings['year_built'][i] <= 2015):
-                            c = 'G5'
-                    elif (buildings['stories'][i] >= 2 and
-                          buildings['stories'][i] <= 5):
-                        b = '25'
-                        if buildings['year_built'][i] <= 1920:
-                            c = 'G1'
-                        elif (buildings['year_built'][i] >= 1921 and
-                              buildings['year_built'][i] <= 1940):
-                            c = 'G2'
-                        elif (buildings['year_built'][i] >= 1941 and
-                              buildings['year_built'][i] <= 1960):
-                            c = 'G3'
-                        elif (buildings['year_built'][i] >= 1961 and
-                              buildings['year_built'][i] <= 1977):
-                            c = 'G4'
-                        elif (buildings['year_built'][i] >= 1978 and
-                              buildings['year_built'][i] <= 1991):
-                            c = 'G5'
-                        elif (buildings['year_built'][i] >= 1992 and
-                              buildings['year_built'][i] <= 2015):
-                            c = 'G6'
-                    elif buildings['stories'][i] >= 6:
-                        b = '5P'
-                        if buildings['year_built'][i] <= 1950:
-                            c = 'G1'
-                        elif (buildings['year_built'][i] >= 1951 and
-                              buildings['year_built'][i] <= 1971):
-                            c = 'G2'
-                        elif (buildings['year_built'][i] >= 1972 and
-                              buildings['year_built'][i] <= 1995):
-                            c = 'G3'
-                        elif (buildings['year_built'][i] >= 1996 and
-                              buildings['year_built'][i] <= 2006):
-                            c = 'G4'
-                        elif (buildings['year_built'][i] >= 2007 and
-                              buildings['year_built'][i] <= 2015):
-                            c = 'G5'
-            elif buildings['year_built'][i] <= 2015:
-                a = 'OT'
-                b = 'NN'
-                if buildings['year_built'][i] <= 1933:
-                    c = 'G1'
-                elif (buildings['year_built'][i] >= 1934 and
-                      buildings['year_built'][i] <= 1950):
-                    c = 'G2'
-                elif (buildings['year_built'][i] >= 1951 and
-                      buildings['year_built'][i] <= 1972):
-                    c = 'G3'
-                elif (buildings['year_built'][i] >= 1973 and
-                      buildings['year_built'][i] <= 1996):
-                    c = 'G4'
-                elif (buildings['year_built'][i] >= 1997 and
-                      buildings['year_built'][i] <= 2006):
-                    c = 'G5'
-                elif (buildings['year_built'][i] >= 2007 and
-                      buildings['year_built'][i] <= 2015):
-                    c = 'G6'
-            # new buildings built by the developer model
-            elif buildings['year_built'][i] > 2015:
-                a = 'NN'
-                b = 'NN'
-                c = 'NN'
-                # alternative if retrofitted: d = 'R'
-            d = 'N'
-            code_i = a+b+c+d
-            code.append(code_i)
-
-            # assign a fragility coefficient based on building code
-            if (code_i == 'SF01G4N' or code_i == 'SF2PG5N' or
-               code_i == 'DU2PG6N' or code_i == 'MF5PG5N' or
-               code_i == 'DU01G4N' or code_i == 'MF25G6N' or
-               code_i == 'MF01G5N' or code_i == 'OTNNG6N'):
-                fragility = 1
-            elif (code_i == 'SF01G3N' or code_i == 'DU01G3N' or
-                  code_i == 'DU2PG5N' or code_i == 'MF25G5N' or
-                  code_i == 'MF01G4N' or code_i == 'OTNNG5N' or
-                  code_i == 'MF5PG4N'):
-                fragility = 1.2
-            elif (code_i == 'SF2PG4N' or code_i == 'MF5PG3N' or
-                  code_i == 'OTNNG4N'):
-                fragility = 1.3
-            elif (code_i == 'MF5PG1N' or code_i == 'OTNNG2N'):
-                fragility = 1.4
-            elif (code_i == 'MF01G3N' or code_i == 'MF5PG2N' or
-                  code_i == 'SF01G2N' or code_i == 'DU01G2N' or
-                  code_i == 'OTNNG3N'):
-                fragility = 1.5
-            elif (code_i == 'DU2PG3N' or code_i == 'DU2PG4N'):
-                fragility = 1.75
-            elif (code_i == 'SF2PG3N' or code_i == 'DU01G1N' or
-                  code_i == 'DU2PG2N' or code_i == 'MF01G2N' or
-                  code_i == 'OTNNG1N'):
-                fragility = 2
-            elif (code_i == 'SF2PG2N'):
-                fragility = 2.25
-            elif (code_i == 'DU2PG1N' or code_i == 'SF01G1N' or
-                  code_i == 'SF2PG1N' or code_i == 'MF01G1N' or
-                  code_i == 'MF25G1N'):
-                fragility = 2.5
-            elif (code_i == 'MF25G2N' or code_i == 'MF25G3N' or
-                  code_i == 'MF25G4N'):
-                fragility = 3
-            elif (code_i == 'NNNNNNN'):
-                fragility = 0
-            fragilities.append(fragility)
-
-        orca.add_injectable("code", code)
-        orca.add_injectable("fragilities", fragilities)
+        buildings = buildings.to_frame(["building_type", "residential_units",
+                                        "stories", "year_built"])
+        code, fragility = code_buildings(buildings)
+
+        orca.add_injectable("code", code.tolist())
+        orca.add_injectable("fragilities", fragility.tolist())
 
         # add codes and fragilities as orca columns
-        code = pd.Series(code, buildings.index)
         orca.add_column('buildings', 'earthquake_code', code)
-        fragility = pd.Series(fragilities, buildings.index)
         orca.add_column('buildings', 'fragility_coef', fragility)
 
         # generate random number, multiply by fragilities
-        buildings = orca.get_table('buildings')
-        rand_eq = np.random.random(len(buildings))
-        destroy_eq = pd.Series(rand_eq*fragility)
+        rand_eq = earthquake_random_state.random_sample(len(buildings))
+        destroy_eq = pd.Series(rand_eq*fragility, buildings.index)
         orca.add_column('buildings', 'eq_destroy', destroy_eq)
 
         # generate random number for fire
-        rand_fire = pd.Series(np.random.random(len(buildings)))
+        rand_fire = pd.Series(
+            earthquake_random_state.random_sample(len(buildings)),
+            buildings.index)
         orca.add_column('buildings', 'fire_destroy', rand_fire)
 
 
+# percent of new buildings destroyed by MMI (shaking intensity, rounded) -
+# MMI 6 and below destroys no new buildings and above 9 is treated as 9
+NEW_BUILDING_PCT = {7: .002, 8: .01, 9: .05}
+
+
+def _round_half_up(s):
+    # matches python 2's round for the non-negative counts used below
+    return np.floor(s + .5)
+
+
+def _top_n_by_group(values, groups, n):
+    # flags the n[i] largest values in the group of each row i
+    rank = values.groupby(groups).rank(method="first", ascending=False)
+    return rank <= n
+
+
+def select_eq_buildings(buildings, tract_rates, random_state=np.random):
+    """
+    Pick the buildings destroyed by the earthquake and by the fires which
+    follow it, all tracts at once.  In each tract the prop_eq share of
+    buildings with the highest eq_destroy is destroyed, then a random
+    share of the new buildings based on the shaking, then the prop_fire
+    share of the remaining buildings with the highest fire_destroy.
+
+    Parameters
+    ----------
+    buildings : DataFrame
+        Must contain tract, eq_destroy, fire_destroy and year_built
+    tract_rates : DataFrame
+        Indexed by tract, must contain prop_eq, prop_fire and shaking
+    random_state : RandomState, optional
+        Stream from which to sample the new buildings, defaults to the
+        global numpy stream
+
+    Returns
+    -------
+    existing, new, fire : Index
+        Building ids destroyed for each reason - a new building can be in
+        both existing and new, as it could in the per-tract loop
+    """
+    # buildings on parcels without a tract are never destroyed
+    df = buildings[buildings.tract.notnull()]
+    tract = df.tract
+    rates = tract_rates.reindex(tract)
+    rates.index = df.index
+
+    # existing buildings
+    # select the buildings with highest fragility co-efficient
+    # (and random no.) based on census tract pct to be destroyed
+    n_eq = _round_half_up(tract.map(tract.value_counts()) * rates.prop_eq)
+    existing = _top_n_by_group(df.eq_destroy, tract, n_eq)
+
+    # new buildings
+    # randomly select buildings to be destroyed based on the percentage
+    # for the tract's shaking
+    is_new = df.year_built > 2015
+    new_tract = tract[is_new]
+    mmi = _round_half_up(rates.shaking[is_new]).clip(upper=9)
+    n_new = _round_half_up(new_tract.map(new_tract.value_counts()) *
+                           mmi.map(NEW_BUILDING_PCT).fillna(0))
+    rand = pd.Series(random_state.random_sample(is_new.sum()),
+                     new_tract.index)
+    new = _top_n_by_group(rand, new_tract, n_new).\
+        reindex(df.index).fillna(False).astype('bool')
+
+    # fire buildings
+    # select buildings to be destroyed by fire by looking only at
+    # remaining buildings, based on random number and census tract pct
+    remain = ~existing & ~new
+    remain_tract = tract[remain]
+    n_fire = _round_half_up(remain_tract.map(remain_tract.value_counts()) *
+                            rates.prop_fire[remain])
+    fire = _top_n_by_group(df.fire_destroy[remain], remain_tract, n_fire)
+
+    return df.index[existing.values], df.index[new.values], \
+        remain_tract.index[fire.values]
+
+
 @orca.step()
 def earthquake_demolish(parcels, parcels_tract, tracts_earthquake, buildings,
-                        households, jobs, residential_units, year, earthquake):
+                        households, jobs, residential_units, year, earthquake,
+                        earthquake_random_state):
     if year == 2035 and earthquake:
         # assign each parcel to a census tract
         # using the lookup table created with "parcel_tract_assignment.ipynb"
@@ -253,92 +255,25 @@ def earthquake_demolish(parcels, parcels_tract, tracts_earthquake, buildings,
         print "Number of parcels with census tracts is: %d" % len(census_tract)
         orca.add_column('parcels', 'tract', census_tract)
 
-        # group parcels by their census tract
-        parcels_tract['parcel_id'] = parcels_tract.index
-        parcels_tract = parcels_tract.to_frame(columns=['parcel_id',
-                                                        'census_tract'])
-        parcels_tract = parcels_tract[['census_tract', 'parcel_id']]
-        tract_parcels_grp = []
-        tracts = []
-        parcels_tract = sorted(parcels_tract.values, key=itemgetter(0))
-        for tract, parcels in itertools.groupby(parcels_tract,
-                                                key=itemgetter(0)):
-            tract_parcels_grp.append(list(parcels))
-            tracts.append(tract)
-        print "Number of census tract groups is: %d" % len(tract_parcels_grp)
-
-        # for the parcels in each tract, destroy X% of parcels in that tract
-        tracts_earthquake = tracts_earthquake.to_frame()
-        tracts_earthquake = tracts_earthquake.sort_values(by=['tract_ba'])
-        tracts_earthquake = tracts_earthquake.reset_index(drop=True)
-
-        buildings = buildings.to_frame()
-        eq_buildings = []
-        existing_buildings = []
-        new_buildings = []
-        fire_buildings = []
-
-        for i in range(len(tracts)):
-            grp = [x[1] for x in tract_parcels_grp[i]]
-            buildings_i = buildings[buildings['parcel_id'].isin(grp)]
-
-            # existing buildings
-            # select the buildings with highest fragility co-efficient
-            # (and random no.) based on census tract pct to be destroyed
-            existing_pct = tracts_earthquake['prop_eq'][i]
-            build_frag = buildings_i['eq_destroy'].sort_values(ascending=False)
-            top_build_frag = build_frag[: int(round(
-                len(build_frag) * existing_pct))]
-            # add to a list of buildings to destroy
-            buildings_top = top_build_frag.index
-            existing_buildings.extend(buildings_top)
-            eq_buildings.extend(buildings_top)
-
-            # new buildings
-            # translate MMI to a probability
-            # in-model is also nice if probabilities associated with
-            # new buildings change
-            buildings_new = buildings_i[buildings_i['year_built'] > 2015]
-            if len(buildings_new) > 0:
-                mmi = int(round(tracts_earthquake['shaking'][i]))
-                if mmi < 6:
-                    new_pct = 0
-                elif mmi == 7:
-                    new_pct = .002
-                elif mmi == 8:
-                    new_pct = .01
-                elif mmi == 9:
-                    new_pct = .05
-                # randomly select buildings to be destroyed based on
-                # percentages
-                new_no = int(round(len(buildings_new)*new_pct))
-                buildings_new_rand = np.random.choice(buildings_new.index,
-                                                      new_no, replace=False)
-                # add to a list of buildings to destroy
-                if len(buildings_new_rand) > 0:
-                    new_buildings.extend(buildings_new_rand)
-                    eq_buildings.extend(buildings_new_rand)
-
-            # fire buildings
-            # select buildings to be destroyed by fire by looking only at
-            # remaining buildings
-            fire_pct = tracts_earthquake['prop_fire'][i]
-            buildings_i_remain = buildings_i[~buildings_i.index.isin
-                                             (buildings_top)]
-            if len(buildings_new) > 0:
-                buildings_i_remain = buildings_i_remain[~buildings_i_remain.
-                                                        index.isin
-                                                        (buildings_new_rand)]
-            # select buildings to be destroyed based on random number
-            # and census tract pct
-            fire_buildings_rand = buildings_i_remain['fire_destroy']. \
-                sort_values(ascending=False)
-            top_fire_buildings = fire_buildings_rand[: int(round(
-                len(fire_buildings_rand) * fire_pct))]
-            # add to a list of buildings to destroy
-            buildings_fire = top_fire_buildings.index
-            fire_buildings.extend(buildings_fire)
-            eq_buildings.extend(buildings_fire)
+        # the damage probabilities are matched to the census tracts in
+        # sorted order
+        tracts = np.sort(census_tract.unique())
+        print "Number of census tract groups is: %d" % len(tracts)
+        tract_rates = tracts_earthquake.to_frame().\
+            sort_values(by=['tract_ba']).iloc[:len(tracts)]
+        tract_rates.index = tracts
+
+        buildings = buildings.to_frame(["parcel_id", "year_built",
+                                        "eq_destroy", "fire_destroy"])
+        buildings["tract"] = census_tract.reindex(buildings.parcel_id).values
+
+        existing_buildings, new_buildings, fire_buildings = \
+            select_eq_buildings(buildings, tract_rates,
+                                earthquake_random_state)
+        existing_buildings = list(existing_buildings)
+        new_buildings = list(new_buildings)
+        fire_buildings = list(fire_buildings)
+        eq_buildings = existing_buildings + new_buildings + fire_buildings
 
         print "Total number of buildings being destroyed is: %d" \
             % len(eq_buildings)
@@ -1,13 +1,16 @@
 from urbansim.utils import misc
 import os
 import sys
+import hashlib
 import orca
 import yaml
 import datasources
 import variables
 from utils import parcel_id_to_geom_id, geom_id_to_parcel_id, add_buildings
 from utils import round_series_match_target, groupby_random_choice
-from urbansim.utils import networks
+from utils import run_developer_for_targets, run_feasibility
+from schema import apply_schema
+from urbansim.models import util
 import pandana.network as pdna
 from urbansim_defaults import models
 from urbansim_defaults import utils
@@ -37,6 +40,9 @@ def households_transition(households, household_controls, year, settings):
                                 year,
                                 settings['households_transition'],
                                 "building_id")
+    # the new households can upcast the compact column types
+    orca.add_table("households", apply_schema(
+        "households", orca.get_table("households").local))
     s = orca.get_table('households').base_income_quartile.value_counts()
     print "Distribution by income after:\n", (s/s.sum())
     return ret
@@ -430,11 +436,12 @@ def alt_feasibility(parcels, settings,
     # use the cap rate from settings.yaml
     config.cap_rate = settings["cap_rate"]
 
-    utils.run_feasibility(parcels,
-                          parcel_sales_price_sqft_func,
-                          parcel_is_allowed_func,
-                          config=config,
-                          **kwargs)
+    run_feasibility(parcels,
+                    parcel_sales_price_sqft_func,
+                    parcel_is_allowed_func,
+                    config=config,
+                    processes=settings.get("feasibility_processes", 1),
+                    **kwargs)
 
     f = subsidies.policy_modifications_of_profit(
         orca.get_table('feasibility').to_frame(),
@@ -501,62 +508,25 @@ def residential_developer(feasibility, households, buildings, parcels, year,
         targets.append((parcels.index == parcels.index,
                         num_units, None, "none"))
 
-    for parcel_mask, target, final_target, juris in targets:
-
-        print "Running developer for %s with target of %d" % \
-            (str(juris), target)
+    new_buildings = run_developer_for_targets(
+        "residential",
+        targets,
+        buildings,
+        "residential_units",
+        parcels.parcel_size,
+        parcels.ave_sqft_per_unit,
+        parcels.total_residential_units,
+        feasibility,
+        year=year,
+        form_to_btype_callback=form_to_btype_func,
+        add_more_columns_callback=add_extra_columns_func,
+        profit_to_prob_func=subsidies.profit_to_prob_func,
+        **kwargs)
+
+    if new_buildings is not None:
+        new_buildings["subsidized"] = False
 
-        # this was a fairly heinous bug - have to get the building wrapper
-        # again because the buildings df gets modified by the run_developer
-        # method below
-        buildings = orca.get_table('buildings')
-
-        new_buildings = utils.run_developer(
-            "residential",
-            households,
-            buildings,
-            "residential_units",
-            parcels.parcel_size[parcel_mask],
-            parcels.ave_sqft_per_unit[parcel_mask],
-            parcels.total_residential_units[parcel_mask],
-            feasibility,
-            year=year,
-            form_to_btype_callback=form_to_btype_func,
-            add_more_columns_callback=add_extra_columns_func,
-            num_units_to_build=target,
-            profit_to_prob_func=subsidies.profit_to_prob_func,
-            **kwargs)
-
-        buildings = orca.get_table('buildings')
-
-        if new_buildings is not None:
-            new_buildings["subsidized"] = False
-
-        if final_target is not None and new_buildings is not None:
-            # make sure we don't overbuild the target for the whole simulation
-            overshoot = new_buildings.net_units.sum() - final_target
-
-            if overshoot > 0:
-                index = new_buildings.tail(1).index[0]
-                index = int(index)
-                # make sure we don't get into a negative unit situation
-                current_units = buildings.local.loc[index, "residential_units"]
-                # only can reduce by as many units as we have
-                overshoot = min(overshoot, current_units)
-                # used below - this is the pct we need to reduce the building
-                overshoot_pct = \
-                    (current_units - overshoot) / float(current_units)
-
-                buildings.local.loc[index, "residential_units"] -= overshoot
-
-                # we also need to fix the other columns so they make sense
-                for col in ["residential_sqft", "building_sqft",
-                            "deed_restricted_units"]:
-                    val = buildings.local.loc[index, col]
-                    # reduce by pct but round to int
-                    buildings.local.loc[index, col] = int(val * overshoot_pct)
-
-        summary.add_parcel_output(new_buildings)
+    summary.add_parcel_output(new_buildings)
 
 
 @orca.step()
@@ -596,33 +566,28 @@ def retail_developer(jobs, buildings, parcels, nodes, feasibility,
     # order by weighted random sample
     feasibility = feasibility.sample(frac=1.0, weights=p)
 
-    bldgs = buildings.to_frame(buildings.local_columns + ["general_type"])
-
-    devs = []
-
-    for dev_id, d in feasibility.iterrows():
-
-        if target <= 0:
-            break
-
-        # any special logic to filter these devs?
-
-        # remove new dev sqft from target
-        target -= d.non_residential_sqft
-
-        # add redeveloped sqft to target
-        filt = "general_type == 'Retail' and parcel_id == %d" % \
-            d["parcel_id"]
-        target += bldgs.query(filt).non_residential_sqft.sum()
-
-        devs.append(d)
-
-    if len(devs) == 0:
+    # each dev removes its new sqft from the target and adds back the retail
+    # sqft it redevelops on its parcel
+    bldgs = buildings.to_frame(["parcel_id", "general_type",
+                                "non_residential_sqft"])
+    redev_sqft = bldgs[bldgs.general_type == "Retail"].\
+        groupby("parcel_id").non_residential_sqft.sum()
+    net_sqft = feasibility.non_residential_sqft.values - \
+        redev_sqft.reindex(feasibility.parcel_id.values).fillna(0).values
+
+    # take devs in order while there's target left - the target left before
+    # each dev is the target less the net sqft of the devs before it
+    remaining = target - np.concatenate([[0], np.cumsum(net_sqft)])
+    met = np.flatnonzero(remaining[:-1] <= 0)
+    num_devs = met[0] if len(met) else len(feasibility)
+    target = remaining[num_devs]
+
+    if num_devs == 0:
         return
 
     # record keeping - add extra columns to match building dataframe
     # add the buidings and demolish old buildings, and add to debug output
-    devs = pd.DataFrame(devs, columns=feasibility.columns)
+    devs = feasibility.iloc[:num_devs].copy()
 
     print "Building {:,} retail sqft in {:,} projects".format(
         devs.non_residential_sqft.sum(), len(devs))
@@ -697,48 +662,38 @@ def office_developer(feasibility, jobs, buildings, parcels, year,
                         (target, current_total)
                     continue
 
-                targets.append((juris_name == juris, target, juris))
+                targets.append((juris_name == juris, target, None, juris))
                 num_units -= target
 
             # other cities not in the targets get the remaining target
-            targets.append((~juris_name.isin(juris_list), num_units, "none"))
+            targets.append((~juris_name.isin(juris_list), num_units, None,
+                            "none"))
 
         else:
             # otherwise use all parcels with total number of units
-            targets.append((parcels.index == parcels.index, num_units, "none"))
-
-        for parcel_mask, target, juris in targets:
-
-            print "Running developer for %s with target of %d" % \
-                (str(juris), target)
-            print "Parcels in play:\n", pd.Series(parcel_mask).value_counts()
-
-            # this was a fairly heinous bug - have to get the building wrapper
-            # again because the buildings df gets modified by the run_developer
-            # method below
-            buildings = orca.get_table('buildings')
-
-            new_buildings = utils.run_developer(
-                typ.lower(),
-                jobs,
-                buildings,
-                "job_spaces",
-                parcels.parcel_size[parcel_mask],
-                parcels.ave_sqft_per_unit[parcel_mask],
-                parcels.total_job_spaces[parcel_mask],
-                feasibility,
-                year=year,
-                form_to_btype_callback=form_to_btype_func,
-                add_more_columns_callback=add_extra_columns_func,
-                residential=False,
-                num_units_to_build=target,
-                profit_to_prob_func=subsidies.profit_to_prob_func,
-                **dev_settings['kwargs'])
-
-            if new_buildings is not None:
-                new_buildings["subsidized"] = False
-
-            summary.add_parcel_output(new_buildings)
+            targets.append((parcels.index == parcels.index, num_units, None,
+                            "none"))
+
+        new_buildings = run_developer_for_targets(
+            typ.lower(),
+            targets,
+            buildings,
+            "job_spaces",
+            parcels.parcel_size,
+            parcels.ave_sqft_per_unit,
+            parcels.total_job_spaces,
+            feasibility,
+            year=year,
+            form_to_btype_callback=form_to_btype_func,
+            add_more_columns_callback=add_extra_columns_func,
+            residential=False,
+            profit_to_prob_func=subsidies.profit_to_prob_func,
+            **dev_settings['kwargs'])
+
+        if new_buildings is not None:
+            new_buildings["subsidized"] = False
+
+        summary.add_parcel_output(new_buildings)
 
 
 @orca.step()
@@ -833,54 +788,63 @@ def developer_reprocess(buildings, year, years_per_iter, jobs,
         sqft_by_gtype / 1000000.0
 
 
-def proportional_job_allocation(parcel_id):
-    # this method takes a parcel and increases the number of jobs on the
-    # parcel in proportion to the ratio of sectors that existed in the base yr
+def proportional_job_allocation(parcel_ids):
+    # this method takes parcels and increases the number of jobs on the
+    # parcels in proportion to the ratio of sectors that existed in the base yr
     # this is because elcms can't get the distribution right in some cases, eg
     # to keep mostly gov't jobs in city hall, etc - these are largely
     # institutions and not subject to the market
 
-    # get buildings on this parcel
+    # get buildings on these parcels
     buildings = orca.get_table("buildings").to_frame(
-        ["parcel_id", "job_spaces", "zone_id", "year_built"]).\
-        query("parcel_id == %d" % parcel_id)
+        ["parcel_id", "job_spaces", "year_built"])
+    buildings = buildings[buildings.parcel_id.isin(parcel_ids)]
+    new_buildings = buildings[buildings.year_built > 2015]
 
-    # get jobs in those buildings
     all_jobs = orca.get_table("jobs").local
-    jobs = all_jobs[
-        all_jobs.building_id.isin(buildings.query("year_built <= 2015").index)]
-
-    # get job distribution by sector for this parcel
-    job_dist = jobs.empsix.value_counts()
 
     # only add jobs to new buildings records
-    for index, building in buildings.query("year_built > 2015").iterrows():
-
-        num_new_jobs = building.job_spaces - len(
-            all_jobs.query("building_id == %d" % index))
-
-        if num_new_jobs == 0:
-            continue
-
-        sectors = np.random.choice(job_dist.index, size=num_new_jobs,
-                                   p=job_dist/job_dist.sum())
-        new_jobs = pd.DataFrame({"empsix": sectors, "building_id": index})
-        # make sure index is incrementing
-        new_jobs.index = new_jobs.index + 1 + np.max(all_jobs.index.values)
+    num_new_jobs = (new_buildings.job_spaces - all_jobs.building_id.
+                    value_counts().reindex(new_buildings.index).fillna(0)).\
+        astype('int')
+    num_new_jobs = num_new_jobs[num_new_jobs > 0]
+    if len(num_new_jobs) == 0:
+        return
 
-        print "Adding {} new jobs to parcel {} with proportional model".format(
-            num_new_jobs, parcel_id)
-        print new_jobs.head()
-        all_jobs = all_jobs.append(new_jobs)
-        orca.add_table("jobs", all_jobs)
+    # sampling existing jobs on the parcel with replacement is the same as
+    # sampling sectors in proportion to the parcel's distribution of jobs
+    old_jobs = all_jobs[all_jobs.building_id.isin(
+        buildings.index[buildings.year_built <= 2015])]
+    old_jobs_parcel = misc.reindex(buildings.parcel_id, old_jobs.building_id)
+    new_buildings = new_buildings.loc[num_new_jobs.index]
+    num_new_jobs_parcel = num_new_jobs.groupby(new_buildings.parcel_id).sum()
+    sampled_jobs = groupby_random_choice(old_jobs_parcel, num_new_jobs_parcel)
+
+    # the sample is ordered by parcel so order the buildings the same way
+    order = np.argsort(new_buildings.parcel_id.values, kind='mergesort')
+    new_jobs = pd.DataFrame({
+        "empsix": all_jobs.empsix.loc[sampled_jobs.index].values,
+        "building_id": np.repeat(num_new_jobs.index.values[order],
+                                 num_new_jobs.values[order])
+    })
+    # make sure index is incrementing
+    new_jobs.index = new_jobs.index + 1 + np.max(all_jobs.index.values)
+
+    print "Adding {} new jobs to {} parcels with proportional model".format(
+        len(new_jobs), len(num_new_jobs_parcel))
+    print new_jobs.head()
+    orca.add_table("jobs", apply_schema("jobs", all_jobs.append(new_jobs)))
 
 
 @orca.step()
 def static_parcel_proportional_job_allocation(static_parcels):
-    for parcel_id in static_parcels:
-        proportional_job_allocation(parcel_id)
+    proportional_job_allocation(static_parcels)
 
 
+# the contraction and precompute below run at every start.  they can't be
+# cached as no version of pandana serializes the contraction hierarchy or
+# the precomputed range queries - Network.save_hdf5 / from_hdf5 (pandana
+# 0.4+) only store the nodes and edges and rebuild the network from them
 def make_network(name, weight_col, max_distance):
     st = pd.HDFStore(os.path.join(misc.data_dir(), name), "r")
     nodes, edges = st.nodes, st.edges
@@ -944,9 +908,69 @@ def local_pois(settings):
     df.to_csv('local_poi_distances.csv')
 
 
+# the network aggregations are expensive and many of their inputs (e.g.
+# industrial job spaces) don't change from one year to the next, so the
+# input to each aggregation is hashed and last time's result is reused when
+# the hash hasn't changed.  pandana can only aggregate over all the nodes
+# at once, so this is as fine-grained as the reuse can get - otherwise this
+# is the same as networks.from_yaml
+_network_aggregations = {}
+
+
+def _aggregation_input_hash(df, variable):
+    h = hashlib.md5(str(sorted(variable.items())))
+    for col in df.columns:
+        h.update(np.ascontiguousarray(df[col].values))
+    return h.hexdigest()
+
+
+def network_aggregations(net, cfgname):
+    cfg = yaml.load(open(misc.config(cfgname)))
+    node_col = cfg["node_col"]
+    nodes = pd.DataFrame(index=net.node_ids)
+    reused = 0
+
+    for variable in cfg['variable_definitions']:
+        name = variable["name"]
+        vname = variable.get("varname", None)
+
+        flds = [vname] if vname else []
+        flds.append(node_col)
+        if "filters" in variable:
+            flds += util.columns_in_filters(variable["filters"])
+
+        df = orca.get_table(variable["dataframe"]).to_frame(flds)
+        if "filters" in variable:
+            df = util.apply_filter_query(df, variable["filters"])
+        df = df[[node_col, vname]] if vname else df[[node_col]]
+
+        key = (id(net), cfgname, name)
+        input_hash = _aggregation_input_hash(df, variable)
+        if key in _network_aggregations and \
+                _network_aggregations[key][0] == input_hash:
+            nodes[name] = _network_aggregations[key][1]
+            reused += 1
+            continue
+
+        print "Computing %s" % name
+        net.set(df[node_col], variable=df[vname] if vname else None)
+        nodes[name] = net.aggregate(variable["radius"],
+                                    type=variable.get("aggregation", "sum"),
+                                    decay=variable.get("decay", "linear"))
+        if "apply" in variable:
+            nodes[name] = nodes[name].apply(eval(variable["apply"]))
+
+        _network_aggregations[key] = (input_hash, nodes[name])
+
+    print "Reused %d of %d aggregations in %s with unchanged inputs" % \
+        (reused, len(cfg['variable_definitions']), cfgname)
+
+    return nodes
+
+
 @orca.step()
 def neighborhood_vars(net):
-    nodes = networks.from_yaml(net["walk"], "neighborhood_vars.yaml")
+    nodes = network_aggregations(net["walk"], "neighborhood_vars.yaml")
     nodes = nodes.replace(-np.inf, np.nan)
     nodes = nodes.replace(np.inf, np.nan)
     nodes = nodes.fillna(0)
@@ -957,7 +981,7 @@ def neighborhood_vars(net):
 
 @orca.step()
 def regional_vars(net):
-    nodes = networks.from_yaml(net["drive"], "regional_vars.yaml")
+    nodes = network_aggregations(net["drive"], "regional_vars.yaml")
     nodes = nodes.fillna(0)
 
     nodes2 = pd.read_csv('data/regional_poi_distances.csv',
@@ -996,7 +1020,7 @@ def regional_pois(settings, landmarks):
 
 @orca.step()
 def price_vars(net):
-    nodes2 = networks.from_yaml(net["walk"], "price_vars.yaml")
+    nodes2 = network_aggregations(net["walk"], "price_vars.yaml")
     nodes2 = nodes2.fillna(0)
     print nodes2.describe()
     nodes = orca.get_table('nodes')
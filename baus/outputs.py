@@ -0,0 +1,131 @@
+import os
+import atexit
+import multiprocessing
+import orca
+import pandas as pd
+from schema import to_storable
+
+
+# the summary steps write their tables through these functions so that the
+# format of the run outputs can be set in settings.yaml with output_format:
+#
+#    csv  - csvs only, the default and what downstream consumers expect
+#    hdf  - compressed h5s only, which keep the column types and are much
+#           smaller and faster to write and read than csvs
+#    both - h5s and csvs
+#
+# file names are always given with a .csv extension and the h5 goes next to
+# it with a .h5 extension
+#
+# with write_outputs_in_background (on by default), each csv is written by a
+# forked process so the simulation moves on to the next step while the csv
+# is formatted and written.  the fork gets a snapshot of the table without
+# it being pickled, so later changes to the table don't leak into the
+# output, and the formatting, which holds the GIL for most of its time,
+# runs on another core rather than slowing down the models (a thread which
+# did this slowed the models running alongside it about 3.5x).  at most
+# one writer per spare core runs at once, and on a single core machine the
+# csvs are written in the simulation process as there's nothing to gain.
+# flush_writes waits for all the pending writes - it's called before
+# anything reads a table back, before a checkpoint and at the end of the run
+#
+# the h5s are always written by the simulation process - forking a process
+# which has h5s open and writing h5s from it isn't safe with pytables
+
+OUTPUT_FORMATS = ["csv", "hdf", "both"]
+
+
+def output_format():
+    fmt = orca.get_injectable("settings").get("output_format", "csv")
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError("output_format must be one of %s, not %s" %
+                         (OUTPUT_FORMATS, fmt))
+    return fmt
+
+
+def hdf_fname(fname):
+    return os.path.splitext(fname)[0] + ".h5"
+
+
+def _write_table(df, fname, fmt, index):
+    fnames = []
+
+    if fmt in ["hdf", "both"]:
+        # the fixed h5 format can't store categoricals (e.g. area types)
+        to_storable(df).to_hdf(hdf_fname(fname), key="df", mode="w",
+                               complevel=1, complib="blosc")
+        fnames.append(hdf_fname(fname))
+
+    if fmt in ["csv", "both"]:
+        df.to_csv(fname, index=index)
+        fnames.append(fname)
+
+    for f in fnames:
+        if not os.path.exists(f) or os.path.getsize(f) == 0:
+            raise Exception("%s was not written" % f)
+
+
+# (process, file name) of the csvs being written in the background
+_writers = []
+
+
+def _wait_for_writer(errors):
+    p, fname = _writers.pop(0)
+    p.join()
+    # the writer raises, and so exits with an error, if the csv wasn't written
+    if p.exitcode != 0:
+        errors.append("%s: writer exited with code %s" % (fname, p.exitcode))
+
+
+def _report_errors(errors, raise_errors):
+    if not errors:
+        return
+
+    msg = "Failed to write outputs:\n    " + "\n    ".join(errors)
+    if raise_errors:
+        raise Exception(msg)
+    print msg
+
+
+def write_table(df, fname, index=True):
+    fmt = output_format()
+    max_writers = multiprocessing.cpu_count() - 1
+
+    if max_writers < 1 or not orca.get_injectable("settings").get(
+            "write_outputs_in_background", True):
+        _write_table(df, fname, fmt, index)
+        return
+
+    if fmt in ["hdf", "both"]:
+        _write_table(df, fname, "hdf", index)
+    if fmt == "hdf":
+        return
+
+    errors = []
+    while len(_writers) >= max_writers:
+        _wait_for_writer(errors)
+    p = multiprocessing.Process(target=_write_table,
+                                args=(df, fname, "csv", index))
+    p.start()
+    _writers.append((p, fname))
+    _report_errors(errors, True)
+
+
+def flush_writes(raise_errors=True):
+    errors = []
+    while _writers:
+        _wait_for_writer(errors)
+    _report_errors(errors, raise_errors)
+
+
+# don't lose pending writes if the process exits without a flush
+atexit.register(flush_writes, raise_errors=False)
+
+
+def read_table(fname):
+    # read back a table written by write_table, preferring the h5 as it has
+    # the original types
+    flush_writes()
+    if os.path.exists(hdf_fname(fname)):
+        return pd.read_hdf(hdf_fname(fname), "df")
+    return pd.read_csv(fname, index_col=0)
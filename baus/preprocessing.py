@@ -2,6 +2,7 @@ import orca
 import pandas as pd
 from urbansim.utils import misc
 from validation import assert_series_equal
+from utils import groupby_random_choice
 
 
 # the way this works is there is an orca step to do jobs allocation, which
@@ -135,28 +136,18 @@ def assign_deed_restricted_units(df, parcels):
     zone_ids = misc.reindex(parcels.zone_id, df.parcel_id).\
         reindex(df.index).fillna(-1)
     # sample deed restricted units to match current deed restricted unit
-    # zone totals
-    for taz, row in pd.read_csv('data/deed_restricted_zone_totals.csv',
-                                index_col='taz_key').iterrows():
+    # zone totals - all zones are sampled at once, weighted by the number
+    # of residential units in each building
+    totals = pd.read_csv('data/deed_restricted_zone_totals.csv',
+                         index_col='taz_key').units
 
-        cnt = row["units"]
+    potential_add_locations = df.residential_units > 0
+    building_ids = groupby_random_choice(
+        zone_ids[potential_add_locations], totals[totals > 0],
+        replace=True, weights=df.residential_units[potential_add_locations])
 
-        if cnt <= 0:
-            continue
-
-        potential_add_locations = df.residential_units[
-            (zone_ids == taz) &
-            (df.residential_units > 0)]
-
-        assert len(potential_add_locations) > 0
-
-        weights = potential_add_locations / potential_add_locations.sum()
-
-        buildings_ids = potential_add_locations.sample(
-            cnt, replace=True, weights=weights)
-
-        units = pd.Series(buildings_ids.index.values).value_counts()
-        df.loc[units.index, "deed_restricted_units"] += units.values
+    units = pd.Series(building_ids.index.values).value_counts()
+    df.loc[units.index, "deed_restricted_units"] += units.values
 
     print "Total deed restricted units after random selection: %d" % \
         df.deed_restricted_units.sum()
@@ -263,6 +254,29 @@ def correct_baseyear_vacancies(buildings, parcels, jobs, store):
     return buildings
 
 
+def apply_manual_edits(df, edits, table):
+    # apply the edits for this table one attribute at a time, so that each
+    # column gets a single update - if an id is edited more than once the
+    # last edit wins
+    edits = edits[edits.table == table].drop_duplicates(
+        ["id", "attribute"], keep="last")
+
+    missing = ~edits.id.isin(df.index)
+    if missing.any():
+        print "Skipping %d manual edits for ids not in %s: %s" % \
+            (missing.sum(), table, list(edits.id[missing].unique()))
+        edits = edits[~missing]
+
+    for col, col_edits in edits.groupby("attribute"):
+        values = col_edits.new_value
+        # new_value holds numbers and strings, so convert for numeric columns
+        if df[col].dtype.kind in "biuf":
+            values = pd.to_numeric(values)
+        df.loc[col_edits.id.values, col] = values.values
+
+    return df
+
+
 @orca.step()
 def preproc_buildings(store, parcels, manual_edits):
     # start with buildings from urbansim_defaults
@@ -284,11 +298,7 @@ def preproc_buildings(store, parcels, manual_edits):
                   'costar_rent'], axis=1)
 
     # apply manual edits
-    edits = manual_edits.local
-    edits = edits[edits.table == 'buildings']
-    for index, row, col, val in \
-            edits[["id", "attribute", "new_value"]].itertuples():
-        df.set_value(row, col, val)
+    df = apply_manual_edits(df, manual_edits.local, 'buildings')
 
     df["residential_units"] = df.residential_units.fillna(0)
 
@@ -0,0 +1,111 @@
+import csv
+import sys
+import time
+import resource
+import orca
+
+
+# this is a lightweight profiler for orca steps - it re-registers every step
+# with a wrapper that records wall time, cpu time, peak memory and the size
+# of the tables the step has injected, and appends one row per step per
+# year to a csv next to the run log.  orca.run is left alone so caching
+# and iteration semantics are exactly the same as an unprofiled run
+
+
+PROFILE_COLUMNS = ["year", "step", "wall_time", "cpu_time",
+                   "peak_rss_mb", "peak_rss_delta_mb", "tables"]
+
+
+def _cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, osx reports bytes
+    if sys.platform == "darwin":
+        return rss / 1024.0 / 1024.0
+    return rss / 1024.0
+
+
+def _table_sizes(tables):
+    # use the raw wrappers so that we never evaluate a table function
+    # just to measure it - function tables report the size of their last
+    # evaluation
+    sizes = []
+    for name in sorted(tables):
+        if not orca.is_table(name):
+            continue
+        tbl = orca.get_raw_table(name)
+        sizes.append("%s:%dx%d" % (name, len(tbl), len(tbl.columns)))
+    return "|".join(sizes)
+
+
+class StepProfiler(object):
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.totals = {}
+        self.f = open(fname, "w")
+        self.writer = csv.writer(self.f)
+        self.writer.writerow(PROFILE_COLUMNS)
+        self.f.flush()
+
+    def wrap_step(self, name):
+        step = orca.get_step(name)
+        tables = orca.get_step_table_names([name])
+
+        def profiled_step():
+            wall, cpu, rss = time.time(), _cpu_time(), _peak_rss_mb()
+            try:
+                return step()
+            finally:
+                self.record(name, time.time() - wall, _cpu_time() - cpu,
+                            rss, tables)
+
+        orca.add_step(name, profiled_step)
+
+    def record(self, name, wall_time, cpu_time, start_rss, tables):
+        year = orca.get_injectable("iter_var") \
+            if orca.is_injectable("iter_var") else None
+        peak_rss = _peak_rss_mb()
+        self.writer.writerow([
+            year if year is not None else "", name,
+            "%.3f" % wall_time, "%.3f" % cpu_time,
+            "%.1f" % peak_rss, "%.1f" % (peak_rss - start_rss),
+            _table_sizes(tables)
+        ])
+        # flush every row so that a crashed run still has a profile
+        self.f.flush()
+        self.totals[name] = self.totals.get(name, 0) + wall_time
+
+    def summary(self, n=10):
+        s = "Slowest steps by total wall time (s):\n"
+        for name, t in sorted(self.totals.items(), key=lambda x: -x[1])[:n]:
+            s += "    %-50s %10.1f\n" % (name, t)
+        return s
+
+    def close(self):
+        self.f.close()
+
+
+def profile_steps(fname, steps=None):
+    """
+    Wrap registered orca steps so that every call is profiled.
+
+    Parameters
+    ----------
+    fname : str
+        Csv file to which to write one row per step per year
+    steps : list of str, optional
+        Names of the steps to profile, defaults to all registered steps
+
+    Returns
+    -------
+    profiler : StepProfiler
+    """
+    profiler = StepProfiler(fname)
+    for name in steps or orca.list_steps():
+        profiler.wrap_step(name)
+    return profiler
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+
+# the compact column types of the agent tables.  the tables are loaded from
+# the store with the default int64 / float64 / object types, which for the
+# multi-million row households, jobs and units tables is several times the
+# memory they need, so the schema is applied when they're loaded and again
+# after any step which appends rows to them (appending rows of a different
+# type upcasts the column back)
+#
+# ids are stored as int32 and small counts and codes as int8, but only if
+# the column has no nulls and its values are whole numbers which fit -
+# otherwise the column is left as it is.  categorical columns are only
+# converted if all their values are categories, so a comparison against a
+# string like empsix == 'RETEMPN' becomes a compare of the integer codes
+#
+# columns which the models rewrite with computed floats (prices, rents and
+# the like) are left as float64 so that the results don't change, and
+# households.tenure stays a string as it's compared against non-categories
+# in the configs (e.g. tenure == 2 in neighborhood_vars.yaml) which raises
+# for a categorical
+
+EMPSIX = ["AGREMPN", "FPSEMPN", "HEREMPN", "MWTEMPN", "OTHEMPN", "RETEMPN"]
+
+SCHEMA = {
+    "households": {
+        "building_id": "int32",
+        "unit_id": "int32",
+        "persons": "int8",
+        "base_income_quartile": "int8",
+        "base_income_octile": "int8"
+    },
+    "jobs": {
+        "building_id": "int32",
+        "sector_id": "int8",
+        "empsix": EMPSIX
+    },
+    "residential_units": {
+        "building_id": "int32",
+        "unit_num": "int32",
+        "num_units": "int8",
+        "deed_restricted": "float32"
+    }
+}
+
+
+def cast_column(s, dtype):
+    # a list of categories means a categorical column
+    if isinstance(dtype, list):
+        if str(s.dtype) == "category" and list(s.cat.categories) == dtype:
+            return s
+        if not s.dropna().isin(dtype).all():
+            return s
+        return pd.Series(pd.Categorical(s, categories=dtype),
+                         index=s.index, name=s.name)
+
+    dtype = np.dtype(dtype)
+    if s.dtype == dtype:
+        return s
+
+    if dtype.kind == "i":
+        if s.dtype.kind not in "iuf" or s.isnull().any():
+            return s
+        if s.dtype.kind == "f" and (s % 1 != 0).any():
+            return s
+        info = np.iinfo(dtype)
+        if len(s) and (s.min() < info.min or s.max() > info.max):
+            return s
+
+    return s.astype(dtype)
+
+
+def apply_schema(name, df):
+    # cast the columns of df, which is the local data of the table name, to
+    # their compact types - df is modified in place and returned
+    for col, dtype in SCHEMA.get(name, {}).items():
+        if col in df.columns:
+            df[col] = cast_column(df[col], dtype)
+    return df
+
+
+def to_storable(df):
+    # the fixed h5 format can't store categoricals, so they're written as
+    # their values and converted back by apply_schema when they're read
+    df = df.copy()
+    for col in df.columns:
+        if str(df[col].dtype) == "category":
+            df[col] = np.asarray(df[col])
+    return df
@@ -7,7 +7,7 @@ from urbansim import accounts
 from urbansim_defaults import utils
 from cStringIO import StringIO
 from urbansim.utils import misc
-from utils import add_buildings
+from utils import add_buildings, run_feasibility
 from urbansim.developer import sqftproforma
 
 
@@ -667,11 +667,12 @@ def subsidized_residential_feasibility(
     config.cap_rate = settings["cap_rate"]
 
     # step 1
-    utils.run_feasibility(parcels,
-                          parcel_sales_price_sqft_func,
-                          parcel_is_allowed_func,
-                          config=config,
-                          **kwargs)
+    run_feasibility(parcels,
+                    parcel_sales_price_sqft_func,
+                    parcel_is_allowed_func,
+                    config=config,
+                    processes=settings.get("feasibility_processes", 1),
+                    **kwargs)
 
     feasibility = orca.get_table("feasibility").to_frame()
     # get rid of the multiindex that comes back from feasibility
@@ -8,28 +8,152 @@ from utils import random_indexes, round_series_match_target,\
     scale_by_target, simple_ipf
 from urbansim.utils import misc
 from scripts.output_csv_utils import format_df
+from outputs import write_table, read_table
+
+
+# the counts and sums of agents by geography which are shared by the
+# summary steps below.  each entry is (output column, column to sum or
+# None to count agents, column to break the agents down by or None for
+# all agents, values of that column to include)
+EMPSIX_SECTORS = ["AGREMPN", "MWTEMPN", "RETEMPN", "FPSEMPN", "HEREMPN",
+                  "OTHEMPN"]
+
+HOUSEHOLD_SUMMARY = [
+    ("tothh", None, None, None),
+    ("hhincq1", None, "base_income_quartile", [1]),
+    ("hhincq2", None, "base_income_quartile", [2]),
+    ("hhincq3", None, "base_income_quartile", [3]),
+    ("hhincq4", None, "base_income_quartile", [4]),
+    ("hhpop", "persons", None, None)
+]
+
+JOB_SUMMARY = [("totemp", None, None, None)] + [
+    (sector.lower(), None, "empsix", [sector]) for sector in EMPSIX_SECTORS
+]
+
+BUILDING_SUMMARY = [
+    ("res_units", "residential_units", None, None),
+    ("sfdu", "residential_units", "building_type", ["HS", "HT"]),
+    ("mfdu", "residential_units", "building_type", ["HM", "MR"]),
+    ("non_residential_sqft", "non_residential_sqft", None, None)
+]
+
+DIAGNOSTIC_BUILDING_SUMMARY = [
+    ("residential_units", "residential_units", None, None),
+    ("job_spaces", "job_spaces", None, None),
+    ("non_residential_sqft", "non_residential_sqft", None, None),
+    ("retail_sqft", "non_residential_sqft", "general_type", ["Retail"]),
+    ("office_sqft", "non_residential_sqft", "general_type", ["Office"]),
+    ("industrial_sqft", "non_residential_sqft", "general_type",
+     ["Industrial"]),
+    ("building_count", None, "general_type", ["Residential"])
+]
+
+
+# the summary steps all join households, jobs and buildings to their
+# buildings and parcels, with overlapping sets of columns.  these tables do
+# each join once per year, with all the columns any of the summary steps
+# use, and are shared by the steps.  they're only cached for the
+# iteration so they must only be used by steps which run after the models
+# have moved agents and built buildings for the year
+SUMMARY_HOUSEHOLD_COLUMNS = [
+    'parcel_id', 'zone_id', 'maz_id', 'pda', 'juris', 'superdistrict',
+    'persons', 'income', 'base_income_quartile']
+
+SUMMARY_JOB_COLUMNS = [
+    'parcel_id', 'zone_id', 'pda', 'juris', 'superdistrict', 'empsix']
+
+SUMMARY_BUILDING_COLUMNS = [
+    'parcel_id', 'zone_id', 'pda', 'juris', 'superdistrict',
+    'performance_zone', 'urbanized', 'acres', 'x', 'y', 'building_type',
+    'general_type', 'year_built', 'stories', 'residential_units',
+    'deed_restricted_units', 'residential_sqft', 'non_residential_sqft',
+    'building_sqft', 'job_spaces', 'residential_price', 'unit_price',
+    'redfin_sale_price', 'non_residential_rent']
+
+
+def merge_summary_columns(target, tables, columns):
+    df = orca.merge_tables(target, tables, columns=columns)
+
+    # merge_tables can suffix columns which are on more than one table -
+    # keep the one from the target table under the original name
+    for col in columns:
+        if col not in df and col + '_x' in df:
+            df = df.rename(columns={col + '_x': col})
+        if col + '_y' in df:
+            del df[col + '_y']
+
+    return df
+
+
+@orca.table(cache=True, cache_scope='iteration')
+def summary_households(parcels, buildings, households):
+    return merge_summary_columns('households',
+                                 [parcels, buildings, households],
+                                 SUMMARY_HOUSEHOLD_COLUMNS)
+
+
+@orca.table(cache=True, cache_scope='iteration')
+def summary_jobs(parcels, buildings, jobs):
+    return merge_summary_columns('jobs', [parcels, buildings, jobs],
+                                 SUMMARY_JOB_COLUMNS)
+
+
+@orca.table(cache=True, cache_scope='iteration')
+def summary_buildings(parcels, buildings):
+    return merge_summary_columns('buildings', [parcels, buildings],
+                                 SUMMARY_BUILDING_COLUMNS)
+
+
+def summarize_agents(df, geography, spec):
+    # compute all the columns in spec for the agents in df by geography.
+    # the columns which break down the same column by the same category
+    # are done together in one groupby on geography and category, and a
+    # geography without any of the agents in a column gets a null, the same
+    # as grouping the filtered agents one column at a time
+    out = {}
+    crosstabs = {}
+    for name, value_col, category_col, values in spec:
+        if category_col is None:
+            grouped = df.groupby(geography)
+            out[name] = grouped.size() if value_col is None \
+                else grouped[value_col].sum()
+        else:
+            labels = crosstabs.setdefault((value_col, category_col), {})
+            for value in values:
+                labels[value] = name
+
+    for (value_col, category_col), labels in crosstabs.items():
+        # as object so that categoricals map to strings and nulls as usual
+        label = df[category_col].astype(object).map(labels)
+        keep = label.notnull()
+        grouped = df[keep].groupby([df[geography][keep], label[keep]])
+        s = grouped.size() if value_col is None \
+            else grouped[value_col].sum()
+        s = s.unstack()
+        for name in s.columns:
+            out[name] = s[name]
+
+    return pd.DataFrame(out, columns=[entry[0] for entry in spec])
 
 
 @orca.step()
 def topsheet(households, jobs, buildings, parcels, zones, year,
              run_number, taz_geography, parcels_zoning_calculations,
              summary, settings, parcels_geography, abag_targets, new_tpp_id,
-             residential_units):
+             residential_units, summary_households, summary_jobs):
 
     hh_by_subregion = misc.reindex(taz_geography.subregion,
                                    households.zone_id).value_counts()
 
-    households_df = orca.merge_tables(
-        'households',
-        [parcels_geography, buildings, households],
-        columns=['pda_id', 'tpp_id', 'income'])
+    households_df = summary_households.to_frame(['parcel_id', 'pda',
+                                                 'income'])
 
-    if settings["use_new_tpp_id_in_topsheet"]:
-        del households_df["tpp_id"]
-        households_df["tpp_id"] = misc.reindex(new_tpp_id.tpp_id,
-                                               households_df.parcel_id)
+    tpp_id = new_tpp_id.tpp_id if settings["use_new_tpp_id_in_topsheet"] \
+        else parcels_geography.tpp_id
+    households_df["tpp_id"] = misc.reindex(tpp_id, households_df.parcel_id)
 
-    hh_by_inpda = households_df.pda_id.notnull().value_counts()
+    hh_by_inpda = households_df.pda.notnull().value_counts()
     hh_by_intpp = households_df.tpp_id.notnull().value_counts()
 
     hhincome_by_intpp = households_df.income.groupby(
@@ -40,14 +164,8 @@ def topsheet(households, jobs, buildings, parcels, zones, year,
     jobs_by_subregion = misc.reindex(taz_geography.subregion,
                                      jobs.zone_id).value_counts()
 
-    jobs_df = orca.merge_tables(
-        'jobs',
-        [parcels, buildings, jobs],
-        columns=['pda'])
-
-    if settings["use_new_tpp_id_in_topsheet"]:
-        jobs_df["tpp_id"] = misc.reindex(new_tpp_id.tpp_id,
-                                         jobs_df.parcel_id)
+    jobs_df = summary_jobs.to_frame(['parcel_id', 'pda'])
+    jobs_df["tpp_id"] = misc.reindex(tpp_id, jobs_df.parcel_id)
 
     jobs_by_inpda = jobs_df.pda.notnull().value_counts()
     jobs_by_intpp = jobs_df.tpp_id.notnull().value_counts()
@@ -218,8 +336,8 @@ def topsheet(households, jobs, buildings, parcels, zones, year,
     jobs_by_housing = jobs_by_county / households_by_county.replace(0, 1)
     write("Jobs/housing balance:\n" + str(jobs_by_housing))
 
-    for geo, typ, corr in compare_to_targets(parcels, buildings, jobs,
-                                             households, abag_targets,
+    for geo, typ, corr in compare_to_targets(summary_households,
+                                             summary_jobs, abag_targets,
                                              write_comparison_dfs=True):
         write("{} in {} have correlation of {:,.4f} with targets".format(
             typ, geo, corr
@@ -228,30 +346,21 @@ def topsheet(households, jobs, buildings, parcels, zones, year,
     f.close()
 
 
-def compare_to_targets(parcels, buildings, jobs, households, abag_targets,
+def compare_to_targets(summary_households, summary_jobs, abag_targets,
                        write_comparison_dfs=False):
 
-    # yes a similar join is used in the summarize step below - but it's
-    # better to keep it clean and separate
-
     abag_targets = abag_targets.to_frame()
     abag_targets["pda_fill_juris"] = abag_targets["joinkey"].\
         replace("Non-PDA", np.nan).replace("Total", np.nan).\
         str.upper().fillna(abag_targets.juris)
 
-    households_df = orca.merge_tables(
-        'households',
-        [parcels, buildings, households],
-        columns=['pda', 'juris'])
+    households_df = summary_households.to_frame(['pda', 'juris'])
 
     households_df["pda_fill_juris"] = \
         households_df.pda.str.upper().replace("Total", np.nan).\
         str.upper().fillna(households_df.juris)
 
-    jobs_df = orca.merge_tables(
-        'jobs',
-        [parcels, buildings, jobs],
-        columns=['pda', 'juris'])
+    jobs_df = summary_jobs.to_frame(['pda', 'juris'])
 
     jobs_df["pda_fill_juris"] = \
         jobs_df.pda.str.upper().fillna(jobs_df.juris)
@@ -296,11 +405,16 @@ def compare_to_targets(parcels, buildings, jobs, households, abag_targets,
 
 
 @orca.step()
-def diagnostic_output(households, buildings, parcels, taz, jobs, settings,
-                      zones, year, summary, run_number, residential_units):
-    households = households.to_frame()
-    buildings = buildings.to_frame()
-    parcels = parcels.to_frame()
+def diagnostic_output(parcels, taz, jobs, settings, zones, year, summary,
+                      run_number, residential_units, summary_households,
+                      summary_buildings):
+    households = summary_households.to_frame(['zone_id', 'income',
+                                              'persons'])
+    buildings = summary_buildings.to_frame([
+        'zone_id', 'general_type', 'residential_units', 'job_spaces',
+        'non_residential_sqft', 'residential_price', 'non_residential_rent'])
+    parcels = parcels.to_frame(['zone_id', 'zoned_du',
+                                'zoned_du_underbuild'])
     zones = zones.to_frame()
 
     zones['zoned_du'] = parcels.groupby('zone_id').zoned_du.sum()
@@ -309,32 +423,27 @@ def diagnostic_output(households, buildings, parcels, taz, jobs, settings,
     zones['zoned_du_underbuild_ratio'] = zones.zoned_du_underbuild /\
         zones.zoned_du
 
-    zones['residential_units'] = buildings.groupby('zone_id').\
-        residential_units.sum()
-    zones['job_spaces'] = buildings.groupby('zone_id').\
-        job_spaces.sum()
+    zone_buildings = summarize_agents(buildings, 'zone_id',
+                                      DIAGNOSTIC_BUILDING_SUMMARY)
+
+    zones['residential_units'] = zone_buildings.residential_units
+    zones['job_spaces'] = zone_buildings.job_spaces
     tothh = households.zone_id.value_counts().reindex(zones.index).fillna(0)
     zones['residential_vacancy'] = \
         1.0 - tothh / zones.residential_units.replace(0, 1)
-    zones['non_residential_sqft'] = buildings.groupby('zone_id').\
-        non_residential_sqft.sum()
+    zones['non_residential_sqft'] = zone_buildings.non_residential_sqft
     totjobs = jobs.zone_id.value_counts().reindex(zones.index).fillna(0)
     zones['non_residential_vacancy'] = \
         1.0 - totjobs / zones.job_spaces.replace(0, 1)
 
-    zones['retail_sqft'] = buildings.query('general_type == "Retail"').\
-        groupby('zone_id').non_residential_sqft.sum()
-    zones['office_sqft'] = buildings.query('general_type == "Office"').\
-        groupby('zone_id').non_residential_sqft.sum()
-    zones['industrial_sqft'] = buildings.query(
-        'general_type == "Industrial"').\
-        groupby('zone_id').non_residential_sqft.sum()
+    zones['retail_sqft'] = zone_buildings.retail_sqft
+    zones['office_sqft'] = zone_buildings.office_sqft
+    zones['industrial_sqft'] = zone_buildings.industrial_sqft
 
     zones['average_income'] = households.groupby('zone_id').income.quantile()
     zones['household_size'] = households.groupby('zone_id').persons.quantile()
 
-    zones['building_count'] = buildings.\
-        query('general_type == "Residential"').groupby('zone_id').size()
+    zones['building_count'] = zone_buildings.building_count
     # this price is the max of the original unit vector belows
     zones['residential_price'] = buildings.\
         query('general_type == "Residential"').groupby('zone_id').\
@@ -360,9 +469,6 @@ def diagnostic_output(households, buildings, parcels, taz, jobs, settings,
         buildings[buildings.general_type == "Industrial"].\
         groupby('zone_id').non_residential_rent.quantile()
 
-    zones['retail_sqft'] = buildings[buildings.general_type == "Retail"].\
-        groupby('zone_id').non_residential_sqft.sum()
-
     zones['retail_to_res_units_ratio'] = \
         zones.retail_sqft / zones.residential_units.replace(0, 1)
 
@@ -378,8 +484,9 @@ def diagnostic_output(households, buildings, parcels, taz, jobs, settings,
 
 
 @orca.step()
-def geographic_summary(parcels, households, jobs, buildings, taz_geography,
-                       run_number, year, summary, final_year):
+def geographic_summary(parcels, taz_geography, run_number, year, summary,
+                       final_year, summary_households, summary_jobs,
+                       summary_buildings):
     # using the following conditional b/c `year` is used to pull a column
     # from a csv based on a string of the year in add_population()
     # and in add_employment() and 2009 is the
@@ -390,43 +497,33 @@ def geographic_summary(parcels, households, jobs, buildings, taz_geography,
     else:
         base = False
 
-    households_df = orca.merge_tables(
-        'households',
-        [parcels, buildings, households],
-        columns=['pda', 'zone_id', 'juris', 'superdistrict',
-                 'persons', 'income', 'base_income_quartile'])
-
-    jobs_df = orca.merge_tables(
-        'jobs',
-        [parcels, buildings, jobs],
-        columns=['pda', 'superdistrict', 'juris', 'zone_id', 'empsix'])
-
-    buildings_df = orca.merge_tables(
-        'buildings',
-        [parcels, buildings],
-        columns=['pda', 'superdistrict', 'juris', 'building_type',
-                 'zone_id', 'residential_units', 'building_sqft',
-                 'non_residential_sqft'])
+    geographies = ['superdistrict', 'pda', 'juris']
 
     parcel_output = summary.parcel_output
 
-    # because merge_tables returns multiple zone_id_'s, but not the one we need
-    buildings_df = buildings_df.rename(columns={'zone_id_x': 'zone_id'})
-
-    geographies = ['superdistrict', 'pda', 'juris']
-
     if year in [2010, 2015, 2020, 2025, 2030, 2035, 2040, 2045, 2050]:
 
-        for geography in geographies:
+        households_df = summary_households.to_frame(
+            ['pda', 'zone_id', 'juris', 'superdistrict', 'persons',
+             'income', 'base_income_quartile'])
 
-            # create table with household/population summaries
+        jobs_df = summary_jobs.to_frame(
+            ['pda', 'superdistrict', 'juris', 'zone_id', 'empsix'])
 
-            summary_table = pd.pivot_table(households_df,
-                                           values=['persons'],
-                                           index=[geography],
-                                           aggfunc=[np.size])
+        # this is also used for the urban footprint summary below
+        buildings_df = summary_buildings.to_frame(
+            ['pda', 'superdistrict', 'juris', 'building_type', 'zone_id',
+             'residential_units', 'building_sqft', 'non_residential_sqft',
+             'urbanized', 'year_built', 'acres'])
 
-            summary_table.columns = ['tothh']
+        for geography in geographies:
+
+            # all the household, job and building counts for this geography
+            agent_summary = pd.concat([
+                summarize_agents(households_df, geography, HOUSEHOLD_SUMMARY),
+                summarize_agents(buildings_df, geography, BUILDING_SUMMARY),
+                summarize_agents(jobs_df, geography, JOB_SUMMARY)
+            ], axis=1)
 
             # fill in 0 values where there are NA's so that summary table
             # outputs are the same over the years otherwise a PDA or summary
@@ -435,58 +532,25 @@ def geographic_summary(parcels, households, jobs, buildings, taz_geography,
                 all_summary_geographies = buildings_df[geography].unique()
             else:
                 all_summary_geographies = parcels[geography].unique()
-            summary_table = \
-                summary_table.reindex(all_summary_geographies).fillna(0)
-
-            # turns out the lines above had to be moved up - if there are no
-            # households in a geography the index is missing that geography
-            # right off the bat.  then when we try and add a jobs or buildings
-            # aggregation that HAS that geography, it doesn't get saved.  ahh
-            # pandas, so powerful but so darn confusing.
-
-            # income quartile counts
-            summary_table['hhincq1'] = \
-                households_df.query("base_income_quartile == 1").\
-                groupby(geography).size()
-            summary_table['hhincq2'] = \
-                households_df.query("base_income_quartile == 2").\
-                groupby(geography).size()
-            summary_table['hhincq3'] = \
-                households_df.query("base_income_quartile == 3").\
-                groupby(geography).size()
-            summary_table['hhincq4'] = \
-                households_df.query("base_income_quartile == 4").\
-                groupby(geography).size()
-
-            # residential buildings by type
-            summary_table['sfdu'] = buildings_df.\
-                query("building_type == 'HS' or building_type == 'HT'").\
-                groupby(geography).residential_units.sum()
-            summary_table['mfdu'] = buildings_df.\
-                query("building_type == 'HM' or building_type == 'MR'").\
-                groupby(geography).residential_units.sum()
-
-            # employees by sector
-            summary_table['totemp'] = jobs_df.\
-                groupby(geography).size()
-            summary_table['agrempn'] = jobs_df.query("empsix == 'AGREMPN'").\
-                groupby(geography).size()
-            summary_table['mwtempn'] = jobs_df.query("empsix == 'MWTEMPN'").\
-                groupby(geography).size()
-            summary_table['retempn'] = jobs_df.query("empsix == 'RETEMPN'").\
-                groupby(geography).size()
-            summary_table['fpsempn'] = jobs_df.query("empsix == 'FPSEMPN'").\
-                groupby(geography).size()
-            summary_table['herempn'] = jobs_df.query("empsix == 'HEREMPN'").\
-                groupby(geography).size()
-            summary_table['othempn'] = jobs_df.query("empsix == 'OTHEMPN'").\
-                groupby(geography).size()
+
+            # only the household count gets zeros for the missing
+            # geographies, the other columns are null where there are no
+            # households, jobs or buildings of that kind
+            summary_table = agent_summary[['tothh']].\
+                reindex(all_summary_geographies).fillna(0)
+
+            # income quartile counts, residential units by building type
+            # and employees by sector
+            for col in ['hhincq1', 'hhincq2', 'hhincq3', 'hhincq4',
+                        'sfdu', 'mfdu', 'totemp'] + \
+                    [sector.lower() for sector in EMPSIX_SECTORS]:
+                summary_table[col] = agent_summary[col]
 
             # summary columns
             summary_table['occupancy_rate'] = summary_table['tothh'] / \
                 (summary_table['sfdu'] + summary_table['mfdu'])
-            summary_table['non_residential_sqft'] = buildings_df.\
-                groupby(geography)['non_residential_sqft'].sum()
+            summary_table['non_residential_sqft'] = \
+                agent_summary.non_residential_sqft
             summary_table['sq_ft_per_employee'] = \
                 summary_table['non_residential_sqft'] / summary_table['totemp']
 
@@ -522,7 +586,7 @@ def geographic_summary(parcels, households, jobs, buildings, taz_geography,
             elif base is True:
                 summary_csv = "runs/run{}_{}_summaries_{}.csv".\
                     format(run_number, geography, 2009)
-            summary_table.to_csv(summary_csv)
+            write_table(summary_table, summary_csv)
 
     # Write Summary of Accounts
     if year == final_year:
@@ -530,7 +594,7 @@ def geographic_summary(parcels, households, jobs, buildings, taz_geography,
         for acct_name, acct in orca.get_injectable("coffer").iteritems():
             fname = "runs/run{}_acctlog_{}_{}.csv".\
                 format(run_number, acct_name, year)
-            acct.to_frame().to_csv(fname)
+            write_table(acct.to_frame(), fname)
 
     # Write Urban Footprint Summary
     if year in [2010, 2015, 2020, 2025, 2030, 2035, 2040, 2045, 2050]:
@@ -540,12 +604,9 @@ def geographic_summary(parcels, households, jobs, buildings, taz_geography,
         # still occurs in 2010 (base year buildings outside of the
         # urbanized area).
 
-        buildings_uf_df = orca.merge_tables(
-            'buildings',
-            [parcels, buildings],
-            columns=['urbanized', 'year_built',
-                     'acres', 'residential_units',
-                     'non_residential_sqft'])
+        buildings_uf_df = buildings_df[['urbanized', 'year_built',
+                                        'acres', 'residential_units',
+                                        'non_residential_sqft']].copy()
 
         buildings_uf_df['count'] = 1
 
@@ -594,16 +655,15 @@ def geographic_summary(parcels, households, jobs, buildings, taz_geography,
                       'denser_greenfield']
         uf_summary_csv = "runs/run{}_urban_footprint_summary_{}.csv".\
             format(run_number, year)
-        df.to_csv(uf_summary_csv)
+        write_table(df, uf_summary_csv)
 
     # Summarize Logsums
     if year in [2010, 2015, 2020, 2025, 2030, 2035, 2040, 2045, 2050]:
         zones = orca.get_table('zones')
         df = zones.to_frame()
         df = df[['zone_cml', 'zone_cnml', 'zone_combo_logsum']]
-        df.to_csv(os.path.join("runs",
-                               "run%d_taz_logsums_%d.csv"
-                               % (run_number, year)))
+        write_table(df, os.path.join("runs", "run%d_taz_logsums_%d.csv"
+                                     % (run_number, year)))
 
 
 @orca.step()
@@ -614,6 +674,9 @@ def building_summary(parcels, run_number, year,
     if year not in [initial_year, final_year]:
         return
 
+    # this doesn't use summary_buildings as the columns of the csv are those
+    # which merge_tables gives (e.g. zone_id is on both tables) and it's
+    # only written twice per run
     df = orca.merge_tables(
         'buildings',
         [parcels, buildings],
@@ -621,14 +684,12 @@ def building_summary(parcels, run_number, year,
                  'unit_price', 'zone_id', 'non_residential_sqft',
                  'deed_restricted_units', 'job_spaces', 'x', 'y'])
 
-    df.to_csv(
-        os.path.join("runs", "run%d_building_data_%d.csv" %
-                     (run_number, year))
-    )
+    write_table(df, os.path.join("runs", "run%d_building_data_%d.csv" %
+                                 (run_number, year)))
 
 
 @orca.step()
-def parcel_summary(parcels, buildings, households, jobs,
+def parcel_summary(parcels, summary_households, summary_jobs,
                    run_number, year,
                    parcels_zoning_calculations,
                    initial_year, final_year):
@@ -651,10 +712,8 @@ def parcel_summary(parcels, buildings, households, jobs,
 
     df = df.join(df2)
 
-    households_df = orca.merge_tables(
-        'households',
-        [buildings, households],
-        columns=['parcel_id', 'base_income_quartile'])
+    households_df = summary_households.to_frame(['parcel_id',
+                                                 'base_income_quartile'])
 
     # add households by quartile on each parcel
     for i in range(1, 5):
@@ -662,28 +721,23 @@ def parcel_summary(parcels, buildings, households, jobs,
             households_df.base_income_quartile == i].\
             parcel_id.value_counts()
 
-    jobs_df = orca.merge_tables(
-        'jobs',
-        [buildings, jobs],
-        columns=['parcel_id', 'empsix'])
+    jobs_df = summary_jobs.to_frame(['parcel_id', 'empsix'])
 
     # add jobs by empsix category on each parcel
     for cat in jobs_df.empsix.unique():
         df[cat] = jobs_df[jobs_df.empsix == cat].\
             parcel_id.value_counts()
 
-    df.to_csv(
-        os.path.join("runs", "run%d_parcel_data_%d.csv" %
-                     (run_number, year))
-    )
+    write_table(df, os.path.join("runs", "run%d_parcel_data_%d.csv" %
+                                 (run_number, year)))
 
     if year == final_year:
 
         # do diff with initial year
 
-        df2 = pd.read_csv(
+        df2 = read_table(
             os.path.join("runs", "run%d_parcel_data_%d.csv" %
-                         (run_number, initial_year)), index_col="parcel_id")
+                         (run_number, initial_year)))
 
         for col in df.columns:
 
@@ -692,10 +746,8 @@ def parcel_summary(parcels, buildings, households, jobs,
 
             df[col] = df[col] - df2[col]
 
-        df.to_csv(
-            os.path.join("runs", "run%d_parcel_data_diff.csv" %
-                         run_number)
-        )
+        write_table(df, os.path.join("runs", "run%d_parcel_data_diff.csv" %
+                                     run_number))
 
 
 @orca.step()
@@ -705,18 +757,16 @@ def travel_model_output(parcels, households, jobs, buildings,
                         taz, base_year_summary_taz,
                         taz_geography, taz_forecast_inputs,
                         maz_forecast_inputs, regional_demographic_forecast,
-                        regional_controls):
+                        regional_controls, summary_households):
 
     if year not in [2010, 2015, 2020, 2025, 2030, 2035, 2040, 2045, 2050]:
         # only summarize for years which are multiples of 5
         return
 
-    households_df = orca.merge_tables('households',
-                                      [parcels, buildings, households],
-                                      columns=['zone_id',
-                                               'base_income_quartile',
-                                               'income', 'persons',
-                                               'maz_id'])
+    households_df = summary_households.to_frame(['zone_id',
+                                                 'base_income_quartile',
+                                                 'income', 'persons',
+                                                 'maz_id'])
 
     taz_df = pd.DataFrame(index=zones.index)
 
@@ -751,27 +801,16 @@ def travel_model_output(parcels, households, jobs, buildings,
 
     jobs_df["zone_id"] = jobs_df.zone_id_x
 
-    def getsectorcounts(sector):
-        return jobs_df.query("empsix == '%s'" % sector).\
-            groupby('zone_id').size()
+    zone_jobs = summarize_agents(jobs_df, 'zone_id', JOB_SUMMARY)
+    for col in ["agrempn", "fpsempn", "herempn", "retempn", "mwtempn",
+                "othempn", "totemp"]:
+        taz_df[col] = zone_jobs[col]
 
-    taz_df["agrempn"] = getsectorcounts("AGREMPN")
-    taz_df["fpsempn"] = getsectorcounts("FPSEMPN")
-    taz_df["herempn"] = getsectorcounts("HEREMPN")
-    taz_df["retempn"] = getsectorcounts("RETEMPN")
-    taz_df["mwtempn"] = getsectorcounts("MWTEMPN")
-    taz_df["othempn"] = getsectorcounts("OTHEMPN")
-    taz_df["totemp"] = jobs_df.groupby('zone_id').size()
-
-    def gethhcounts(filter):
-        return households_df.query(filter).groupby('zone_id').size()
-
-    taz_df["hhincq1"] = gethhcounts("base_income_quartile == 1")
-    taz_df["hhincq2"] = gethhcounts("base_income_quartile == 2")
-    taz_df["hhincq3"] = gethhcounts("base_income_quartile == 3")
-    taz_df["hhincq4"] = gethhcounts("base_income_quartile == 4")
-    taz_df["hhpop"] = households_df.groupby('zone_id').persons.sum()
-    taz_df["tothh"] = households_df.groupby('zone_id').size()
+    zone_households = summarize_agents(households_df, 'zone_id',
+                                       HOUSEHOLD_SUMMARY)
+    for col in ["hhincq1", "hhincq2", "hhincq3", "hhincq4", "hhpop",
+                "tothh"]:
+        taz_df[col] = zone_households[col]
 
     taz_df["shpop62p"] = zone_forecast_inputs.sh_62plus
     taz_df["gqpop"] = zone_forecast_inputs["gqpop" + str(year)[-2:]].fillna(0)
@@ -791,18 +830,13 @@ def travel_model_output(parcels, households, jobs, buildings,
                                        'building_type',
                                        'residential_units',
                                        'building_sqft',
+                                       'non_residential_sqft',
                                        'lot_size_per_unit'])
 
-    taz_df["res_units"] = buildings_df.\
-        groupby('zone_id').residential_units.sum()
-
-    taz_df["mfdu"] = buildings_df.\
-        query("building_type == 'HM' or building_type == 'MR'").\
-        groupby('zone_id').residential_units.sum()
-
-    taz_df["sfdu"] = buildings_df.\
-        query("building_type == 'HS' or building_type == 'HT'").\
-        groupby('zone_id').residential_units.sum()
+    zone_buildings = summarize_agents(buildings_df, 'zone_id',
+                                      BUILDING_SUMMARY)
+    for col in ["res_units", "mfdu", "sfdu"]:
+        taz_df[col] = zone_buildings[col]
 
     f = orca.get_injectable('parcel_first_building_type_is')
 
@@ -894,8 +928,8 @@ def travel_model_output(parcels, households, jobs, buildings,
 
     taz_df.index.name = 'TAZ'
 
-    taz_df.fillna(0).to_csv(
-        "runs/run{}_taz_summaries_{}.csv".format(run_number, year))
+    write_table(taz_df.fillna(0),
+                "runs/run{}_taz_summaries_{}.csv".format(run_number, year))
 
     # aggregate TAZ summaries to create county summaries
 
@@ -948,15 +982,15 @@ def travel_model_output(parcels, households, jobs, buildings,
                            "AGE65P"]]
     county_df = county_df.set_index('COUNTY')
 
-    county_df.fillna(0).to_csv(
-        "runs/run{}_county_summaries_{}.csv".format(run_number, year))
+    write_table(county_df.fillna(0),
+                "runs/run{}_county_summaries_{}.csv".format(run_number, year))
 
     # add region marginals
-    pd.DataFrame(data={'REGION': [1],
-                       'gq_num_hh_region': [tot_gqpop]}).to_csv(
-                 "runs/run{}_regional_marginals_{}.csv".format(run_number,
-                                                               year),
-                 index=False)
+    write_table(pd.DataFrame(data={'REGION': [1],
+                                   'gq_num_hh_region': [tot_gqpop]}),
+                "runs/run{}_regional_marginals_{}.csv".format(run_number,
+                                                              year),
+                index=False)
 
 
 @orca.step()
@@ -1518,8 +1552,8 @@ def hazards_slr_summary(run_number, year, destroy_parcels, slr_demolish,
 
 
 @orca.step()
-def hazards_eq_summary(run_number, year, households, jobs, parcels, buildings,
-                       earthquake):
+def hazards_eq_summary(run_number, year, households, jobs, parcels,
+                       summary_buildings, earthquake):
     if year == 2035 and earthquake:
 
         f = open(os.path.join("runs", "run%d_hazards_eq_%d.log" %
@@ -1616,7 +1650,7 @@ def hazards_eq_summary(run_number, year, households, jobs, parcels, buildings,
                                         % (run_number, year)))
 
     if year in [2030, 2035, 2050]:
-        buildings = buildings.to_frame()
+        buildings = summary_buildings.to_frame()
         buildings_taz = misc.reindex(parcels.zone_id,
                                      buildings.parcel_id)
         buildings['taz'] = buildings_taz
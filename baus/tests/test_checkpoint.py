@@ -0,0 +1,84 @@
+import os
+import orca
+import pandas as pd
+from .. import checkpoint
+from .. import summaries
+
+
+class Summary(object):
+    parcel_output = None
+    zone_output = None
+
+
+def run_parcel_summary(run_number, year, units):
+    summaries.parcel_summary(
+        # the tables aren't given their registered names so that the
+        # registered columns, which read from the store, aren't picked up
+        parcels=orca.DataFrameWrapper("test_parcels", pd.DataFrame({
+            "x": [0., 1.],
+            "y": [0., 1.],
+            "total_residential_units": units,
+            "total_job_spaces": [0, 10],
+            "first_building_type": ["HS", "OF"]
+        }, index=[1, 2])),
+        summary_households=orca.DataFrameWrapper(
+            "test_households", pd.DataFrame({
+                "parcel_id": [1, 2],
+                "base_income_quartile": [1, 4]
+            })),
+        summary_jobs=orca.DataFrameWrapper("test_jobs", pd.DataFrame({
+            "parcel_id": [2],
+            "empsix": ["RETEMPN"]
+        })),
+        run_number=run_number,
+        year=year,
+        parcels_zoning_calculations=orca.DataFrameWrapper(
+            "test_zoning_calculations", pd.DataFrame({
+                "zoned_du": [1, 2],
+                "zoned_du_underbuild": [0, 1],
+                "zoned_du_underbuild_nodev": [0, 1]
+            }, index=[1, 2])),
+        initial_year=2010,
+        final_year=2050)
+
+
+def test_resume_through_final_year(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    os.mkdir("runs")
+    # only the outputs are of interest here, not the tables
+    monkeypatch.setattr(checkpoint, "CHECKPOINT_TABLES", [])
+    orca.add_injectable("settings", {"write_outputs_in_background": False})
+    orca.add_injectable("summary", Summary())
+
+    # the base year of run 1, which writes a checkpoint
+    orca.add_injectable("run_number", 1)
+    run_parcel_summary(1, 2010, [1, 2])
+    checkpoint.write_checkpoint(1, 2010)
+
+    # run 2 resumes from the checkpoint and runs to the final year, which
+    # diffs against the base year parcel data
+    orca.add_injectable("run_number", 2)
+    checkpoint.read_checkpoint(1, 2010)
+    run_parcel_summary(2, 2050, [5, 2])
+
+    assert os.path.exists("runs/run2_parcel_data_2010.csv")
+    assert not os.path.exists("runs/run2_checkpoint_2010.h5")
+    diff = pd.read_csv("runs/run2_parcel_data_diff.csv", index_col=0)
+    assert list(diff.total_residential_units) == [4, 0]
+
+
+def test_remove_old_checkpoints(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    os.mkdir("runs")
+    monkeypatch.setattr(checkpoint, "CHECKPOINT_TABLES", [])
+    orca.add_injectable("summary", Summary())
+
+    # a checkpoint of another run isn't touched
+    checkpoint.write_checkpoint(1, 2010)
+    for year in [2010, 2015, 2020, 2025]:
+        checkpoint.write_checkpoint(2, year, keep=2)
+
+    assert sorted(os.listdir("runs")) == [
+        "run1_checkpoint_2010.h5", "run1_checkpoint_2010.pkl",
+        "run2_checkpoint_2020.h5", "run2_checkpoint_2020.pkl",
+        "run2_checkpoint_2025.h5", "run2_checkpoint_2025.pkl"]
@@ -1,3 +1,6 @@
+import os
+import orca
+import pandas as pd
 from .. import datasources
 
 
@@ -46,3 +49,22 @@ def test_inclusionary_housing_settings():
     assert out["Berkeley"] == .2
     assert out["Oakland"] == .2
     assert out["San Francisco"] == .1
+
+
+def test_stored_columns_of_cold_lazy_table(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    os.mkdir("data")
+    settings = {"store": "test_store.h5"}
+    store = pd.HDFStore(os.path.join("data", settings["store"]), "w")
+    store["lazy_test"] = pd.DataFrame({"a": [1, 2], "b": [3., 4.]})
+
+    @orca.table(cache=True)
+    def lazy_test():
+        return datasources.lazy_store_table("lazy_test", "lazy_test", store,
+                                            settings)
+
+    # nothing has evaluated the table yet
+    assert "lazy_test" not in datasources._lazy_table_columns
+    assert datasources.stored_columns("lazy_test") == ["a", "b"]
+    assert list(orca.get_table("lazy_test").to_frame().b) == [3., 4.]
+    store.close()
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import orca
+from .. import earthquake
+
+
+def destroy_buildings(settings):
+    orca.add_injectable("settings", settings)
+    orca.clear_cache()
+
+    orca.add_table("buildings", pd.DataFrame({
+        "building_type": ["HS", "HM", "OF", "RS"] * 50,
+        "residential_units": [1, 20, 0, 0] * 50,
+        "stories": [1, 5, 10, 2] * 50,
+        "year_built": [1930, 1970, 2005, 2020] * 50
+    }, index=np.arange(1, 201)))
+
+    random_state = orca.get_injectable("earthquake_random_state")
+    earthquake.eq_code_buildings(orca.get_table("buildings"), 2035, True,
+                                 random_state)
+
+    buildings = orca.get_table("buildings").to_frame(
+        ["year_built", "eq_destroy", "fire_destroy"])
+    buildings["tract"] = buildings.index % 5
+    tract_rates = pd.DataFrame({
+        "prop_eq": [.1, .2, .3, .4, .5],
+        "prop_fire": [.05, .05, .1, .1, .2],
+        "shaking": [6, 7, 8, 9, 10]
+    })
+
+    existing, new, fire = earthquake.select_eq_buildings(
+        buildings, tract_rates, orca.get_injectable("earthquake_random_state"))
+    return list(existing), list(new), list(fire)
+
+
+def test_earthquake_seed():
+    first = destroy_buildings({"earthquake_seed": 7})
+    second = destroy_buildings({"earthquake_seed": 7})
+
+    assert all(len(ids) for ids in first)
+    assert first == second
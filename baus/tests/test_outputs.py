@@ -0,0 +1,28 @@
+import multiprocessing
+import orca
+import pandas as pd
+import pytest
+from .. import outputs
+
+
+def test_write_table_in_background(tmpdir, monkeypatch):
+    # a spare core so the csv is written by a forked process
+    monkeypatch.setattr(multiprocessing, "cpu_count", lambda: 2)
+    orca.add_injectable("settings", {"output_format": "both",
+                                     "write_outputs_in_background": True})
+
+    df = pd.DataFrame({"a": [1, 2, 3]}, index=[4, 5, 6])
+    fname = str(tmpdir.join("table.csv"))
+    outputs.write_table(df, fname)
+    # the writer has its own copy of the table
+    df["a"] = 0
+
+    outputs.flush_writes()
+    assert list(pd.read_csv(fname, index_col=0).a) == [1, 2, 3]
+    assert list(pd.read_hdf(outputs.hdf_fname(fname), "df").a) == [1, 2, 3]
+
+    # a csv which can't be written fails the flush
+    orca.get_injectable("settings")["output_format"] = "csv"
+    outputs.write_table(df, str(tmpdir.join("missing", "table.csv")))
+    with pytest.raises(Exception):
+        outputs.flush_writes()
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+from .. import schema
+
+
+def test_apply_schema():
+    jobs = pd.DataFrame({
+        "building_id": [1, -1, 3],
+        "sector_id": [1, 2, 3],
+        "empsix": ["RETEMPN", "AGREMPN", "RETEMPN"],
+        "taz": [1, 2, 3]
+    })
+
+    jobs = schema.apply_schema("jobs", jobs)
+
+    assert jobs.building_id.dtype == np.int32
+    assert jobs.sector_id.dtype == np.int8
+    assert jobs.taz.dtype == np.int64
+    assert str(jobs.empsix.dtype) == "category"
+    assert list(jobs.empsix.cat.categories) == schema.EMPSIX
+    assert list(jobs.empsix == "RETEMPN") == [True, False, True]
+
+    # columns which don't fit the schema are left as they are
+    households = pd.DataFrame({
+        "building_id": [1.0, np.nan],
+        "unit_id": [1.0, 2.5],
+        "persons": [1, 1000]
+    })
+
+    households = schema.apply_schema("households", households)
+
+    assert households.building_id.dtype == np.float64
+    assert households.unit_id.dtype == np.float64
+    assert households.persons.dtype == np.int64
+
+    stored = schema.to_storable(jobs)
+    assert str(stored.empsix.dtype) != "category"
+    assert str(jobs.empsix.dtype) == "category"
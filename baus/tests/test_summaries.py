@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+from .. import summaries
+
+
+def test_summarize_agents():
+    buildings = pd.DataFrame({
+        "zone_id": [1, 1, 1, 2, 2],
+        "building_type": ["HS", "HT", "HM", "HS", "OF"],
+        "residential_units": [1, 2, 10, 1, 0],
+        "non_residential_sqft": [0, 0, 100, 0, 5000]
+    })
+
+    df = summaries.summarize_agents(buildings, "zone_id",
+                                    summaries.BUILDING_SUMMARY)
+
+    assert list(df.columns) == ["res_units", "sfdu", "mfdu",
+                                "non_residential_sqft"]
+    assert list(df.res_units) == [13, 1]
+    assert list(df.sfdu) == [3, 1]
+    assert list(df.non_residential_sqft) == [100, 5000]
+    # no multi-family buildings in zone 2
+    assert df.mfdu.loc[1] == 10 and np.isnan(df.mfdu.loc[2])
@@ -0,0 +1,17 @@
+import pandas as pd
+from .. import ual
+
+
+def test_create_empty_units():
+    buildings = pd.DataFrame({
+        "residential_units": [2, 0, 3],
+        "deed_restricted_units": [1, 0, 2]
+    }, index=[7, 3, 5])
+
+    df = ual._create_empty_units(buildings)
+
+    assert df.index.name == "unit_id"
+    assert list(df.building_id) == [5, 5, 5, 7, 7]
+    assert list(df.unit_num) == [0, 1, 2, 0, 1]
+    assert list(df.deed_restricted) == [1, 1, 0, 1, 0]
+    assert (df.num_units == 1).all()
@@ -0,0 +1,123 @@
+import orca
+import pandas as pd
+from pandas.util import testing as pdt
+from .. import utils
+
+
+def test_groupby_random_choice():
+    s = pd.Series(["a", "a", "a", "b", "b", "c"],
+                  index=[10, 11, 12, 20, 21, 30])
+    counts = pd.Series({"a": 2, "b": 2, "c": 0})
+
+    for replace in [True, False]:
+        out = utils.groupby_random_choice(s, counts, replace=replace,
+                                          random_state=0)
+        assert list(out.values) == ["a", "a", "b", "b"]
+        assert (s.loc[out.index] == out).all()
+        if not replace:
+            assert out.index.is_unique
+
+    # zero weights are never chosen
+    weights = pd.Series([0, 0, 1, 1, 0, 1], index=s.index)
+    out = utils.groupby_random_choice(s, counts, weights=weights,
+                                      random_state=0)
+    assert list(out.index) == [12, 12, 20, 20]
+
+
+def test_run_developer_for_zero_target():
+    orca.add_table("buildings", pd.DataFrame({
+        "parcel_id": [1],
+        "residential_units": [1],
+        "building_type": ["HS"],
+        "year_built": [1950]
+    }, index=[1]))
+    orca.add_table("households", pd.DataFrame({"building_id": [1]}))
+    orca.add_table("jobs", pd.DataFrame({"building_id": [-1]}))
+
+    parcel_ids = pd.Index([1, 2, 3, 4])
+    feasibility = pd.DataFrame({
+        "max_profit_far": 1.0,
+        "max_profit": 1000.0,
+        "residential_sqft": 10000.0,
+        "non_residential_sqft": 0.0
+    }, index=parcel_ids)
+    feasibility.columns = pd.MultiIndex.from_tuples(
+        [("residential", col) for col in feasibility.columns])
+    orca.add_table("feasibility", feasibility)
+
+    juris = pd.Series(["a", "a", "b", "b"], index=parcel_ids)
+    # a target of 0 builds nothing in its jurisdiction rather than falling
+    # back to the region-wide target
+    targets = [(juris == "a", 0, None, "a"), (juris == "b", 100, None, "b")]
+
+    new_buildings = utils.run_developer_for_targets(
+        "residential", targets, orca.get_table("buildings"),
+        "residential_units",
+        pd.Series(10000.0, index=parcel_ids),
+        pd.Series(1000.0, index=parcel_ids),
+        pd.Series(0, index=parcel_ids),
+        orca.get_table("feasibility"), 2020,
+        lambda row: "HM", lambda df: df.assign(stories=2.0))
+
+    assert sorted(new_buildings.parcel_id) == [3, 4]
+    assert new_buildings.residential_units.sum() == 20
+    assert sorted(orca.get_table("buildings").parcel_id) == [1, 3, 4]
+    assert list(orca.get_table("feasibility").local.index) == [1, 2]
+
+
+def test_run_feasibility_for_changed_parcels(monkeypatch):
+    # not in index order, and parcel 2 can't build residential
+    parcel_ids = [5, 3, 8, 1, 7, 12, 10, 2, 6, 4, 11, 9]
+    parcels = pd.DataFrame({
+        "parcel_size": 20000.,
+        "land_cost": 1e6,
+        "max_far": 3.,
+        "max_dua": 80.,
+        "max_height": 60.,
+        "ave_unit_size": 1000.,
+        "total_sqft": 100.
+    }, index=parcel_ids)
+    # residential is a sales price which is converted to a yearly rent
+    prices = pd.DataFrame(40., index=parcel_ids,
+                          columns=["residential", "retail", "office",
+                                   "industrial"])
+    prices["residential"] = 800.
+
+    def feasibility():
+        utils.run_feasibility(
+            # not named parcels so the registered parcels columns aren't used
+            orca.DataFrameWrapper("test_parcels", parcels),
+            lambda use: prices[use],
+            lambda form: pd.Series(
+                (parcels.index != 2) | (form != "residential"), parcels.index),
+            forms_to_test=["residential", "office"],
+            pass_through=["total_sqft"])
+        return orca.get_table("feasibility").to_frame()
+
+    looked_up = []
+    lookup_feasibility = utils.lookup_feasibility
+
+    def count_lookups(pf, dfs, *args):
+        looked_up.append(sum(len(df) for df in dfs.values()))
+        return lookup_feasibility(pf, dfs, *args)
+    monkeypatch.setattr(utils, "lookup_feasibility", count_lookups)
+
+    utils._last_feasibility.clear()
+    feasibility()
+
+    # every column the lookup reads on a different parcel
+    changes = [("parcel_size", 30000.), ("land_cost", 1e5),
+               ("max_far", 1.), ("max_dua", 10.), ("max_height", 30.),
+               ("ave_unit_size", 800.), ("total_sqft", 1.)]
+    for parcel_id, (col, value) in zip(parcel_ids, changes):
+        parcels.loc[parcel_id, col] = value
+    prices.loc[4, "office"] = 20.
+    cached = feasibility()
+
+    utils._last_feasibility.clear()
+    full = feasibility()
+
+    # 11 residential and 12 office parcels, of which 8 have changed
+    assert looked_up == [23, 16, 23]
+    assert len(full.residential.dropna()) and len(full.office.dropna())
+    pdt.assert_frame_equal(cached, full)
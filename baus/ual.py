@@ -10,6 +10,7 @@ from urbansim.developer.developer import Developer as dev
 from urbansim.models.relocation import RelocationModel
 from urbansim.utils import misc
 from urbansim_defaults import utils
+from schema import apply_schema
 
 
 ###############################################################################
@@ -46,34 +47,33 @@ def _create_empty_units(buildings):
     assert np.all(buildings.residential_units.fillna(0) >=
                   buildings.deed_restricted_units.fillna(0))
 
+    # sort the buildings (stably) rather than the units, so the units come
+    # out ordered by building_id and unit_num without sorting millions of rows
+    order = np.argsort(buildings.index.values, kind='mergesort')
+    building_ids = buildings.index.values[order]
+    num_units = buildings.residential_units.values.astype(int)[order]
+    restricted_units = \
+        buildings.deed_restricted_units.values.astype(int)[order]
+
+    # counter of the units in a building - the position of each unit in the
+    # table minus the position of the first unit of its building
+    first_unit = np.repeat(np.cumsum(num_units) - num_units, num_units)
+    unit_num = np.arange(num_units.sum()) - first_unit
+
     df = pd.DataFrame({
         'unit_residential_price': 0.0,
         'unit_residential_rent': 0.0,
         'num_units': 1,
-        'building_id': np.repeat(
-            buildings.index.values,
-            buildings.residential_units.values.astype(int)
-        ),
-        # counter of the units in a building
-        'unit_num': np.concatenate([
-            np.arange(num_units)
-            for num_units in buildings.residential_units.values.astype(int)
-        ]),
-        # also identify deed restricted units
-        'deed_restricted': np.concatenate([
-            np.concatenate([
-                np.ones(restricted_units),
-                np.zeros(num_units - restricted_units)
-            ])
-            # iterate over number of units and deed restricted units too
-            for (num_units, restricted_units) in zip(
-                buildings.residential_units.values.astype(int),
-                buildings.deed_restricted_units.values.astype(int)
-            )
-        ])
-    }).sort_values(by=['building_id', 'unit_num']).reset_index(drop=True)
+        'building_id': np.repeat(building_ids, num_units),
+        'unit_num': unit_num,
+        # also identify deed restricted units - the first restricted_units
+        # units in each building
+        'deed_restricted': (
+            unit_num < np.repeat(restricted_units, num_units)
+        ).astype('float')
+    })
     df.index.name = 'unit_id'
-    return df
+    return apply_schema('residential_units', df)
 
 
 def match_households_to_units(households, residential_units):
@@ -500,7 +500,8 @@ def initialize_new_units(buildings, residential_units):
 
     # Create new units, merge them, and update the table
     new_units = _create_empty_units(new_bldgs)
-    all_units = dev.merge(old_units, new_units)
+    all_units = apply_schema('residential_units',
+                             dev.merge(old_units, new_units))
     all_units.index.name = 'unit_id'
 
     print "Creating %d residential units for %d new buildings" % \
@@ -3,8 +3,11 @@ import numpy as np
 import orca
 import os
 import sys
+from multiprocessing import Pool
 from urbansim_defaults.utils import _remove_developed_buildings
 from urbansim.developer.developer import Developer as dev
+from urbansim.developer import sqftproforma
+from schema import apply_schema
 
 
 #####################
@@ -68,11 +71,344 @@ def add_buildings(buildings, new_buildings,
         old_buildings = \
             _remove_developed_buildings(old_buildings, new_buildings,
                                         unplace_agents)
+        # unplacing agents replaces their tables, which can upcast the
+        # compact column types
+        for tbl in unplace_agents:
+            orca.add_table(tbl, apply_schema(tbl, orca.get_table(tbl).local))
 
-    all_buildings = dev.merge(old_buildings, new_buildings)
+    all_buildings, new_index = dev.merge(old_buildings, new_buildings,
+                                         return_index=True)
 
     orca.add_table("buildings", all_buildings)
 
+    # the ids of the new buildings
+    return new_index
+
+
+# this runs the developer for targets split by jurisdiction, as with the
+# development limits.  targets is a list of (parcel_mask, target,
+# final_target, name) tuples for disjoint sets of parcels - the
+# feasibility is split by target once, each target picks only from its own
+# parcels, and the new buildings for all the targets are added at once.  a
+# final_target is the most which can be built for the rest of the
+# simulation (see trim_overshoot).  returns the new buildings, indexed by
+# building id, or None if nothing was built
+def run_developer_for_targets(form, targets, buildings, supply_fname,
+                              parcel_size, ave_unit_size, current_units,
+                              feasibility, year, form_to_btype_callback,
+                              add_more_columns_callback,
+                              profit_to_prob_func=None, residential=True,
+                              max_parcel_size=2000000, min_unit_size=400,
+                              bldg_sqft_per_job=400.0, target_vacancy=None):
+    # target_vacancy is only used to compute the targets
+    feasibility = feasibility.to_frame()
+
+    target_num = pd.Series(-1, index=parcel_size.index)
+    for i, (parcel_mask, _, _, _) in enumerate(targets):
+        target_num[np.asarray(parcel_mask)] = i
+    target_num = target_num.reindex(feasibility.index).fillna(-1)
+    feasibility_by_target = dict(list(feasibility.groupby(
+        target_num.astype(int).values)))
+
+    # pick modifies the average unit size in place
+    ave_unit_size = ave_unit_size.copy()
+
+    picks = []
+    final_targets = []
+    for i, (_, target, final_target, name) in enumerate(targets):
+
+        print "Running developer for %s with target of %d" % \
+            (str(name), target)
+
+        if i not in feasibility_by_target:
+            continue
+
+        new_buildings = dev(feasibility_by_target[i]).pick(
+            form, target, parcel_size, ave_unit_size, current_units,
+            max_parcel_size=max_parcel_size, min_unit_size=min_unit_size,
+            drop_after_build=False, residential=residential,
+            bldg_sqft_per_job=bldg_sqft_per_job,
+            profit_to_prob_func=profit_to_prob_func)
+
+        if new_buildings is None or len(new_buildings) == 0:
+            continue
+
+        new_buildings["target_num"] = i
+        picks.append(new_buildings)
+        if final_target is not None:
+            final_targets.append((i, final_target))
+
+    if len(picks) == 0:
+        return None
+
+    new_buildings = pd.concat(picks, ignore_index=True)
+
+    # the built parcels are no longer available to later developers
+    orca.add_table("feasibility", feasibility.drop(
+        new_buildings.parcel_id.values))
+
+    new_buildings["year_built"] = year
+    new_buildings["form"] = form
+    new_buildings["building_type"] = \
+        new_buildings.apply(form_to_btype_callback, axis=1)
+    new_buildings = add_more_columns_callback(new_buildings)
+    new_buildings["stories"] = new_buildings.stories.apply(np.ceil)
+
+    new_buildings = trim_overshoot(new_buildings, final_targets)
+    del new_buildings["target_num"]
+
+    print "Adding {:,} buildings with {:,} {}".format(
+        len(new_buildings), int(new_buildings[supply_fname].sum()),
+        supply_fname)
+
+    new_buildings.index = add_buildings(buildings, new_buildings)
+
+    return new_buildings
+
+
+# make sure we don't overbuild the target for the whole simulation - for
+# each (target_num, final_target) in final_targets, the last building
+# picked for the target is scaled down by the amount the target's new
+# buildings overshoot the final target.  all the targets are trimmed at once
+def trim_overshoot(new_buildings, final_targets):
+    final_targets = pd.Series(dict(final_targets))
+    overshoot = new_buildings.groupby("target_num").net_units.sum().\
+        reindex(final_targets.index) - final_targets
+    overshoot = overshoot[overshoot > 0]
+
+    if len(overshoot) == 0:
+        return new_buildings
+
+    last_building = pd.Series(new_buildings.index,
+                              index=new_buildings.target_num.values)
+    last_building = last_building[
+        ~last_building.index.duplicated(keep="last")]
+    index = last_building.loc[overshoot.index].values
+
+    # make sure we don't get into a negative unit situation
+    current_units = new_buildings.residential_units.loc[index].values
+    # only can reduce by as many units as we have
+    overshoot = np.minimum(overshoot.values, current_units)
+    # used below - this is the pct we need to reduce the buildings
+    overshoot_pct = (current_units - overshoot) / current_units.astype(float)
+
+    new_buildings.loc[index, "residential_units"] = current_units - overshoot
+
+    # we also need to fix the other columns so they make sense
+    for col in ["residential_sqft", "building_sqft",
+                "deed_restricted_units"]:
+        # reduce by pct but round to int
+        new_buildings.loc[index, col] = \
+            (new_buildings[col].loc[index].values * overshoot_pct).astype(int)
+
+    return new_buildings
+
+
+# the parcel columns which the pro forma lookup uses, along with the prices
+# for each use and the pass through columns - the feasibility of a parcel
+# is only recomputed when one of these has changed.  this must be kept in
+# line with the columns SqFtProForma.lookup reads, which test_utils checks
+FEASIBILITY_INPUTS = ["parcel_size", "land_cost", "max_far", "max_dua",
+                      "max_height", "ave_unit_size"]
+
+# generating the lookup tables is the slow part of creating a pro forma and
+# they only depend on the config (including the cap rate), so the pro formas
+# are kept for the whole simulation keyed by their config.  the inputs and
+# results of the last feasibility run are kept too, keyed by the config and
+# the options of the run
+_proformas = {}
+_last_feasibility = {}
+
+
+def _config_key(value):
+    # a hashable version of the settings in a pro forma config
+    if isinstance(value, dict):
+        return tuple(sorted((k, _config_key(v)) for k, v in value.items()))
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return tuple(_config_key(v) for v in value)
+    return value
+
+
+def get_proforma(config):
+    key = _config_key(config.__dict__)
+    if key not in _proformas:
+        _proformas[key] = sqftproforma.SqFtProForma(config)
+    return _proformas[key], key
+
+
+# the inputs to the pro forma lookup for the worker processes - the workers
+# are forked so they share these with the parent rather than having them
+# pickled, and are only sent the form and the bounds of the rows they look up
+_lookup_inputs = None
+
+
+def _lookup_chunk(job):
+    form, start, end = job
+    pf, dfs, only_built, pass_through = _lookup_inputs
+    return form, pf.lookup(form, dfs[form].iloc[start:end],
+                           only_built=only_built, pass_through=pass_through)
+
+
+# the pro forma lookup for the parcels in dfs, which maps each form to the
+# parcels to look it up for.  when processes is more than 1 the parcels are
+# split into chunks which are looked up on one pool of processes for all
+# the forms.  the lookup of a parcel doesn't depend on the other parcels so
+# the chunks are just stacked back together
+def lookup_feasibility(pf, dfs, only_built, pass_through, processes=1):
+    global _lookup_inputs
+
+    results = {}
+    jobs = []
+    for form, df in dfs.items():
+        if processes <= 1 or len(df) < 2:
+            results[form] = pf.lookup(form, df, only_built=only_built,
+                                      pass_through=pass_through)
+            continue
+        # a few chunks per process to even out the load
+        num_chunks = min(processes * 4, len(df))
+        bounds = np.linspace(0, len(df), num_chunks + 1).astype("int")
+        jobs += [(form, start, end)
+                 for start, end in zip(bounds[:-1], bounds[1:])]
+
+    if len(jobs) == 0:
+        return results
+
+    _lookup_inputs = (pf, dfs, only_built, pass_through)
+    pool = Pool(processes)
+    try:
+        chunks = pool.map(_lookup_chunk, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+        _lookup_inputs = None
+
+    for form in set(job[0] for job in jobs):
+        form_chunks = [chunk for chunk_form, chunk in chunks
+                       if chunk_form == form and len(chunk)]
+        results[form] = pd.concat(form_chunks).sort_index() \
+            if len(form_chunks) else pd.DataFrame()
+    return results
+
+
+def _changed_parcels(inputs, last_inputs):
+    if last_inputs is None or list(inputs.columns) != \
+            list(last_inputs.columns):
+        return pd.Series(True, index=inputs.index)
+    last_inputs = last_inputs.reindex(inputs.index)
+    same = (inputs == last_inputs) | \
+        (inputs.isnull() & last_inputs.isnull())
+    return ~same.all(axis=1)
+
+
+# similar to the function in urbansim_defaults, except that the pro forma
+# for a config is only created once per simulation, and the feasibility is
+# only recomputed for the parcels whose prices, zoning or existing buildings
+# have changed since the last run with the same config and options (or
+# which weren't allowed to build the form in the last run).  the lookup is
+# run on a pool of processes if processes is more than 1
+def run_feasibility(parcels, parcel_price_callback,
+                    parcel_use_allowed_callback, residential_to_yearly=True,
+                    parcel_filter=None, only_built=True, forms_to_test=None,
+                    config=None, pass_through=[], simple_zoning=False,
+                    processes=1):
+    pf, config_key = get_proforma(
+        config or sqftproforma.SqFtProFormaConfig())
+
+    df = parcels.to_frame()
+
+    if parcel_filter:
+        df = df.query(parcel_filter)
+
+    # add prices for each use
+    for use in pf.config.uses:
+        df[use] = parcel_price_callback(use)
+
+    # convert from cost to yearly rent
+    if residential_to_yearly:
+        df["residential"] *= pf.config.cap_rate
+
+    print "Describe of the yearly rent by use"
+    print df[pf.config.uses].describe()
+
+    input_cols = []
+    for col in FEASIBILITY_INPUTS + list(pf.config.uses) + list(pass_through):
+        if col in df.columns and col not in input_cols:
+            input_cols.append(col)
+    inputs = df[input_cols]
+
+    run_key = (config_key, residential_to_yearly, only_built,
+               tuple(pass_through), simple_zoning)
+    last_inputs, last_results = _last_feasibility.get(run_key, (None, {}))
+    changed = _changed_parcels(inputs, last_inputs)
+
+    forms = forms_to_test or pf.config.forms
+    newdfs = {}
+    lookups = {}
+    for form in forms:
+        allowed = parcel_use_allowed_callback(form).loc[df.index]
+
+        newdf = df[allowed]
+        if simple_zoning:
+            if form == "residential":
+                # these are new computed in the effective max_dua method
+                newdf["max_far"] = pd.Series()
+                newdf["max_height"] = pd.Series()
+            else:
+                # these are new computed in the effective max_far method
+                newdf["max_dua"] = pd.Series()
+                newdf["max_height"] = pd.Series()
+
+        last_allowed, last_result = last_results.get(form, (None, None))
+        if last_result is None:
+            recompute = newdf.index
+        else:
+            recompute = newdf.index[changed.loc[newdf.index].values |
+                                    ~newdf.index.isin(last_allowed)]
+
+        print "Computing feasibility for form %s (%d of %d parcels)" % \
+            (form, len(recompute), len(newdf))
+
+        newdfs[form] = newdf, recompute
+        if last_result is None or len(recompute):
+            lookups[form] = newdf.loc[recompute]
+
+    # all the forms are looked up at once so there's only one pool of
+    # processes per run
+    lookups = lookup_feasibility(pf, lookups, only_built, pass_through,
+                                 processes)
+
+    d = {}
+    results = {}
+    for form in forms:
+        newdf, recompute = newdfs[form]
+        last_allowed, last_result = last_results.get(form, (None, None))
+
+        result = lookups.get(form, pd.DataFrame())
+        if residential_to_yearly and "residential" in pass_through and \
+                len(result):
+            result["residential"] /= pf.config.cap_rate
+
+        if last_result is not None:
+            keep = newdf.index.difference(recompute)
+            result = pd.concat([
+                last_result[last_result.index.isin(keep)], result
+            ])
+
+        # the parcels are in the order of the parcels table whether or not
+        # their feasibility was kept from the last run
+        result = result.reindex(newdf.index[newdf.index.isin(result.index)])
+
+        d[form] = result
+        results[form] = (newdf.index, result)
+
+    _last_feasibility[run_key] = (inputs, results)
+
+    far_predictions = pd.concat(d.values(), keys=d.keys(), axis=1)
+
+    orca.add_table("feasibility", far_predictions)
+
 
 # assume df1 and df2 each have 2 float columns specifying x and y
 # in the same order and coordinate system and no nans.  returns the indexes
@@ -110,15 +446,73 @@ def parcel_id_to_geom_id(s):
 # thought of as grouping the dataframe "s" came from and sampling
 # count number of rows from each group.  I mean, you group the
 # dataframe and then counts gives you the count you want to sample
-# from each group.
-def groupby_random_choice(s, counts, replace=True):
+# from each group.  s is sorted by group once and all the groups are
+# sampled together, optionally with weights (aligned with s) and a seed
+# or RandomState for a reproducible sample.
+def groupby_random_choice(s, counts, replace=True, weights=None,
+                          random_state=None):
     if counts.sum() == 0:
         return pd.Series()
 
-    return pd.concat([
-        s[s == grp].sample(cnt, replace=replace)
-        for grp, cnt in counts[counts > 0].iteritems()
-    ])
+    if random_state is None:
+        random_state = np.random
+    elif not hasattr(random_state, "random_sample"):
+        random_state = np.random.RandomState(random_state)
+
+    counts = counts[counts > 0]
+    cnts = counts.values.astype('int')
+
+    # sort the locations by group so each group is a contiguous slice
+    # [starts, starts + sizes) of order, dropping groups we don't sample
+    codes = pd.Index(counts.index).get_indexer(s.values)
+    order = np.argsort(codes, kind='mergesort')
+    order = order[codes[order] >= 0]
+    group = codes[order]
+    sizes = np.bincount(group, minlength=len(counts))
+    starts = np.cumsum(sizes) - sizes
+
+    short = (sizes == 0) if replace else (sizes < cnts)
+    if short.any():
+        raise ValueError("Not enough locations to sample from for %s" %
+                         list(counts.index[short]))
+
+    if weights is not None:
+        weights = np.asarray(weights, dtype='float')[order]
+
+    if replace:
+        # one draw per sample, mapped into its group's slice
+        draw_group = np.repeat(np.arange(len(counts)), cnts)
+        u = random_state.random_sample(len(draw_group))
+        if weights is None:
+            pos = starts[draw_group] + \
+                (u * sizes[draw_group]).astype('int')
+        else:
+            # invert the cumulative weights within each group
+            cum = np.cumsum(weights)
+            cum0 = np.concatenate([[0], cum])
+            lo, hi = cum0[starts], cum0[starts + sizes]
+            if (hi - lo <= 0).any():
+                raise ValueError("Weights sum to zero for %s" %
+                                 list(counts.index[hi - lo <= 0]))
+            target = lo[draw_group] + u * (hi - lo)[draw_group]
+            pos = np.minimum(np.searchsorted(cum, target, side='right'),
+                             (starts + sizes - 1)[draw_group])
+    else:
+        # give each location a random key and take the counts largest keys
+        # in each group - with weights the keys are u ** (1 / w), which is
+        # the same as drawing the locations one at a time
+        u = random_state.random_sample(len(order))
+        if weights is None:
+            keys = u
+        else:
+            with np.errstate(divide='ignore'):
+                keys = np.log(u) / weights
+        ranked = np.lexsort((-keys, group))
+        rank = np.arange(len(ranked)) - starts[group[ranked]]
+        pos = ranked[rank < cnts[group[ranked]]]
+
+    idx = order[pos]
+    return pd.Series(s.values[idx], index=s.index[idx])
 
 
 # pick random indexes from s without replacement
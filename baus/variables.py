@@ -803,38 +803,14 @@ def subzone(parcels, parcels_subzone):
 
 
 @orca.column('parcels', cache=True, cache_scope='iteration')
-def cml(parcels, mandatory_accessibility,
-        accessibilities_segmentation):
-    mand_acc = mandatory_accessibility.local
-    acc_seg = accessibilities_segmentation.local
-    cols_to_sum = []
-    for col in mand_acc.columns[~mand_acc.columns.isin(['destChoiceAlt',
-                                                        'taz', 'subzone',
-                                                        'weighted_sum'])]:
-        if col in acc_seg.columns:
-            mand_acc[col] = ((mand_acc[col] - mand_acc[col].min()) /
-                             0.0134) * acc_seg.loc[0, col]
-            cols_to_sum.append(col)
-    mand_acc['weighted_sum'] = mand_acc[cols_to_sum].sum(axis=1)
-    df = misc.reindex(mand_acc.weighted_sum, parcels.subzone)
+def cml(parcels, weighted_logsums):
+    df = misc.reindex(weighted_logsums.cml, parcels.subzone)
     return df.reindex(parcels.index).fillna(-1)
 
 
 @orca.column('parcels', cache=True, cache_scope='iteration')
-def cnml(parcels, non_mandatory_accessibility,
-         accessibilities_segmentation):
-    nmand_acc = non_mandatory_accessibility.local
-    acc_seg = accessibilities_segmentation.local
-    cols_to_sum = []
-    for col in nmand_acc.columns[~nmand_acc.columns.isin(['destChoiceAlt',
-                                                          'taz', 'subzone',
-                                                          'weighted_sum'])]:
-        if col in acc_seg.columns:
-            nmand_acc[col] = ((nmand_acc[col] - nmand_acc[col].min()) /
-                              0.0175) * acc_seg.loc[0, col]
-            cols_to_sum.append(col)
-    nmand_acc['weighted_sum'] = nmand_acc[cols_to_sum].sum(axis=1)
-    df = misc.reindex(nmand_acc.weighted_sum, parcels.subzone)
+def cnml(parcels, weighted_logsums):
+    df = misc.reindex(weighted_logsums.cnml, parcels.subzone)
     return df.reindex(parcels.index).fillna(-1)
 
 
@@ -845,39 +821,13 @@ def combo_logsum(parcels):
 
 
 @orca.column('zones', cache=True, cache_scope='iteration')
-def zone_cml(year, mandatory_accessibility,
-             accessibilities_segmentation):
-    mand_acc = mandatory_accessibility.local
-    acc_seg = accessibilities_segmentation.local
-    mand_acc = mand_acc.groupby('taz').median()
-    cols_to_sum = []
-    for col in mand_acc.columns[~mand_acc.columns.isin(['destChoiceAlt',
-                                                        'taz', 'subzone',
-                                                        'weighted_sum'])]:
-        if col in acc_seg.columns:
-            mand_acc[col] = ((mand_acc[col] - mand_acc[col].min()) /
-                             0.0134) * acc_seg.loc[0, col]
-            cols_to_sum.append(col)
-        mand_acc['weighted_sum'] = mand_acc[cols_to_sum].sum(axis=1)
-    return mand_acc['weighted_sum']
+def zone_cml(zone_weighted_logsums):
+    return zone_weighted_logsums.cml
 
 
 @orca.column('zones', cache=True, cache_scope='iteration')
-def zone_cnml(year, non_mandatory_accessibility,
-              accessibilities_segmentation):
-    nmand_acc = non_mandatory_accessibility.local
-    acc_seg = accessibilities_segmentation.local
-    nmand_acc = nmand_acc.groupby('taz').median()
-    cols_to_sum = []
-    for col in nmand_acc.columns[~nmand_acc.columns.isin(['destChoiceAlt',
-                                                          'taz', 'subzone',
-                                                          'weighted_sum'])]:
-        if col in acc_seg.columns:
-            nmand_acc[col] = ((nmand_acc[col] - nmand_acc[col].min()) /
-                              0.0175) * acc_seg.loc[0, col]
-            cols_to_sum.append(col)
-    nmand_acc['weighted_sum'] = nmand_acc[cols_to_sum].sum(axis=1)
-    return nmand_acc['weighted_sum']
+def zone_cnml(zone_weighted_logsums):
+    return zone_weighted_logsums.cnml
 
 
 @orca.column('zones', cache=True, cache_scope='iteration')
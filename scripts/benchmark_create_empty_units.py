@@ -0,0 +1,66 @@
+import time
+import numpy as np
+import pandas as pd
+from baus.ual import _create_empty_units
+
+# benchmark for the creation of empty residential units from buildings at
+# base year scale (about 1.8M buildings and 3.4M units).  the previous,
+# per-building implementation is kept here to check that the output hasn't
+# changed and to show the speedup
+
+NUM_BUILDINGS = 1800000
+np.random.seed(0)
+
+
+def _create_empty_units_loop(buildings):
+    return pd.DataFrame({
+        'unit_residential_price': 0.0,
+        'unit_residential_rent': 0.0,
+        'num_units': 1,
+        'building_id': np.repeat(
+            buildings.index.values,
+            buildings.residential_units.values.astype(int)
+        ),
+        'unit_num': np.concatenate([
+            np.arange(num_units)
+            for num_units in buildings.residential_units.values.astype(int)
+        ]),
+        'deed_restricted': np.concatenate([
+            np.concatenate([
+                np.ones(restricted_units),
+                np.zeros(num_units - restricted_units)
+            ])
+            for (num_units, restricted_units) in zip(
+                buildings.residential_units.values.astype(int),
+                buildings.deed_restricted_units.values.astype(int)
+            )
+        ])
+    }).sort_values(by=['building_id', 'unit_num']).reset_index(drop=True)
+
+
+# mostly single family with a long tail of large multi-family buildings,
+# in shuffled order like the buildings table after the developer has run
+residential_units = np.where(
+    np.random.random(NUM_BUILDINGS) < .98,
+    np.random.randint(0, 3, NUM_BUILDINGS),
+    np.random.randint(0, 100, NUM_BUILDINGS))
+deed_restricted_units = (residential_units *
+                         np.random.random(NUM_BUILDINGS) * .2).astype(int)
+buildings = pd.DataFrame({
+    "residential_units": residential_units,
+    "deed_restricted_units": deed_restricted_units
+}, index=np.random.permutation(NUM_BUILDINGS))
+
+print "%d buildings, %d units" % (len(buildings), residential_units.sum())
+
+t1 = time.time()
+df1 = _create_empty_units_loop(buildings)
+print "Per-building implementation: %.2fs" % (time.time() - t1)
+
+t1 = time.time()
+df2 = _create_empty_units(buildings)
+print "Vectorized implementation: %.2fs" % (time.time() - t1)
+
+for col in df1.columns:
+    assert np.array_equal(df1[col].values, df2[col].values), col
+print "Outputs are identical"
@@ -0,0 +1,54 @@
+import time
+import numpy as np
+import pandas as pd
+from baus.utils import groupby_random_choice
+
+# benchmark for sampling locations by group (e.g. buildings by juris, as in
+# accessory_units and the proportional jobs model) over 1.5M candidate
+# locations in 150 groups.  the previous implementation, which scans the
+# whole series once per group, is kept here for comparison
+
+NUM_LOCATIONS = 1500000
+NUM_GROUPS = 150
+np.random.seed(0)
+
+
+def groupby_random_choice_loop(s, counts, replace=True):
+    return pd.concat([
+        s[s == grp].sample(cnt, replace=replace)
+        for grp, cnt in counts[counts > 0].iteritems()
+    ])
+
+
+groups = ["juris%d" % i for i in range(NUM_GROUPS)]
+# uneven group sizes, like jurisdictions
+s = pd.Series(np.random.choice(groups, NUM_LOCATIONS,
+                               p=np.random.dirichlet(np.ones(NUM_GROUPS))),
+              index=np.random.permutation(NUM_LOCATIONS))
+counts = (s.value_counts() * .01).astype('int')
+counts = counts[counts > 0]
+weights = pd.Series(np.random.random(NUM_LOCATIONS), s.index)
+
+print "%d locations in %d groups, sampling %d" % \
+    (len(s), NUM_GROUPS, counts.sum())
+
+for replace in [True, False]:
+    t1 = time.time()
+    groupby_random_choice_loop(s, counts, replace=replace)
+    print "Per-group implementation (replace=%s): %.2fs" % \
+        (replace, time.time() - t1)
+
+    t1 = time.time()
+    out = groupby_random_choice(s, counts, replace=replace)
+    print "Vectorized implementation (replace=%s): %.2fs" % \
+        (replace, time.time() - t1)
+
+    t1 = time.time()
+    out = groupby_random_choice(s, counts, replace=replace,
+                                weights=weights)
+    print "Vectorized implementation (replace=%s, weighted): %.2fs" % \
+        (replace, time.time() - t1)
+
+    # every group gets the right number of samples from the right group
+    assert (out.value_counts().reindex(counts.index) == counts).all()
+    assert (s.loc[out.index].values == out.values).all()
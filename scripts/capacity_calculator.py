@@ -11,6 +11,10 @@ parser.add_argument('-s', action='store', dest='scenario',
 
 options = parser.parse_args()
 
+# only a few columns are used, so read them from the store on demand rather
+# than loading whole tables
+orca.add_injectable("lazy_tables", True)
+
 if options.scenario:
     orca.add_injectable("scenario", options.scenario)
 
@@ -5,6 +5,9 @@ import pandas as pd
 import numpy as np
 
 orca.add_injectable("scenario", "baseline")
+# only a few columns are used, so read them from the store on demand rather
+# than loading whole tables
+orca.add_injectable("lazy_tables", True)
 orca.get_injectable("settings")["dont_build_most_dense_building"] = False
 
 '''
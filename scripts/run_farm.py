@@ -0,0 +1,144 @@
+import os
+import sys
+import argparse
+import itertools
+import subprocess
+from multiprocessing import Pool, cpu_count
+from urbansim.utils import misc
+
+# this script launches many simulations at once on a local process pool in
+# order to produce replicates for averaging (see average_runs.py).  every
+# run gets its own run number, random seed and working directory - the
+# working directory has its own runs and output directories and symlinks
+# to the shared (read-only) code and configs.  its data directory symlinks
+# each of the shared data files, so the base year h5 and the other inputs
+# aren't copied.
+#
+# the logsum cache is built once in the shared data directory before the
+# runs start, and each run's data/cache symlinks the finished cache files,
+# so the runs only read them.  a run which does have to write to a cache
+# (e.g. a logsum file which isn't in the settings) writes to its own copy
+# of it rather than to the shared file, so workers never write the same h5
+#
+# the runs are separate processes so each one still loads the base year
+# h5 and builds and precomputes its own pandana networks - pandana can't
+# save a built network for the runs to share
+#
+# run this from the top level of the repo, e.g.
+#
+#    python scripts/run_farm.py -s 0 1 --seeds 10 -n 8
+#
+# which runs 10 seeds of scenarios 0 and 1 eight at a time
+
+BAUS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SHARED = ["baus", "baus.py", "configs"]
+
+parser = argparse.ArgumentParser(description='Run many simulations.')
+
+parser.add_argument('-s', action='store', dest='scenarios', nargs='+',
+                    default=["0"], help='scenarios to run')
+
+parser.add_argument('--seeds', action='store', dest='seeds', type=int,
+                    default=1, help='number of seeds to run per scenario')
+
+parser.add_argument('--first-seed', action='store', dest='first_seed',
+                    type=int, default=0, help='first random seed to use')
+
+parser.add_argument('-n', action='store', dest='processes', type=int,
+                    default=cpu_count(), help='number of runs at once')
+
+parser.add_argument('-d', action='store', dest='farm_dir', default="farm",
+                    help='directory in which to put run directories')
+
+parser.add_argument('-y', action='store', dest='out_year', type=int,
+                    help='the year to which to run each simulation')
+
+
+def make_workdir(farm_dir, run_num):
+    workdir = os.path.abspath(os.path.join(farm_dir, "run%d" % run_num))
+    for d in ["runs", "output"]:
+        d = os.path.join(workdir, d)
+        if not os.path.exists(d):
+            os.makedirs(d)
+    for name in SHARED:
+        link = os.path.join(workdir, name)
+        if not os.path.lexists(link):
+            os.symlink(os.path.join(BAUS_DIR, name), link)
+    make_data_dir(os.path.join(workdir, "data"))
+    return workdir
+
+
+def make_data_dir(data_dir):
+    shared = os.path.join(BAUS_DIR, "data")
+    # work directories made before the caches were per run link the whole
+    # shared data directory
+    if os.path.islink(data_dir):
+        os.unlink(data_dir)
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+    link_files(shared, data_dir, skip=["cache"])
+
+    cache = os.path.join(data_dir, "cache")
+    if not os.path.exists(cache):
+        os.makedirs(cache)
+    if os.path.exists(os.path.join(shared, "cache")):
+        link_files(os.path.join(shared, "cache"), cache)
+
+
+def link_files(from_dir, to_dir, skip=[]):
+    for name in os.listdir(from_dir):
+        link = os.path.join(to_dir, name)
+        if name not in skip and not os.path.lexists(link):
+            os.symlink(os.path.join(from_dir, name), link)
+
+
+def warm_caches():
+    # builds the logsum cache in the shared data directory - this runs in a
+    # separate process as the models register themselves with orca when
+    # they're imported
+    subprocess.check_call([
+        sys.executable, "-c",
+        "from baus import datasources; datasources.warm_logsum_cache()"
+    ], cwd=BAUS_DIR)
+
+
+def run_one(job):
+    run_num, scenario, seed, workdir, out_year = job
+
+    cmd = [sys.executable, "baus.py", "-s", scenario,
+           "--run-number", str(run_num), "--random-seed", str(seed),
+           "--disable-slack"]
+    if out_year:
+        cmd += ["-y", str(out_year)]
+
+    print "Starting run %d (scenario %s, seed %d) in %s" % \
+        (run_num, scenario, seed, workdir)
+    ret = subprocess.call(cmd, cwd=workdir)
+    print "Finished run %d with return code %d" % (run_num, ret)
+
+    return run_num, scenario, seed, ret
+
+
+if __name__ == '__main__':
+    options = parser.parse_args()
+
+    # before the work directories link to the caches
+    warm_caches()
+
+    jobs = []
+    for scenario, seed in itertools.product(
+            options.scenarios,
+            range(options.first_seed, options.first_seed + options.seeds)):
+        # reserve run numbers up front so the workers never race on RUNNUM
+        run_num = misc.get_run_number()
+        workdir = make_workdir(options.farm_dir, run_num)
+        jobs.append((run_num, scenario, seed, workdir, options.out_year))
+
+    pool = Pool(options.processes)
+    results = pool.map(run_one, jobs, chunksize=1)
+    pool.close()
+    pool.join()
+
+    print "\nrun_number,scenario,seed,return_code"
+    for result in results:
+        print "%d,%s,%d,%d" % result
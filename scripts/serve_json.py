@@ -12,6 +12,10 @@ cors = CORS(app)
 
 MAX_PARCELS_RETURNED = 5000
 
+# only a few columns are used, so read them from the store on demand rather
+# than loading whole tables
+orca.add_injectable("lazy_tables", True)
+
 print "Loading"
 
 store = pd.HDFStore('data/bayarea_v3.h5')